@@ -0,0 +1,104 @@
+"""Холодный старт: время импорта и время до первого getUpdates.
+
+Импорт меряется через `python -X importtime`, а время до первого опроса -
+запуском `hw_food_bot.cli polling` против заглушки Bot API (`BOT_API_URL`):
+от старта процесса до прихода запроса getUpdates.
+
+    python benchmarks/cold_start.py --runs 5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from stub_servers import StubServer, telegram_handler  # noqa: E402
+
+SRC = str(Path(__file__).parent.parent / "src")
+IMPORT_TARGET = "import hw_food_bot.cli, hw_food_bot.bot"
+
+
+def bot_env(**extra: str) -> dict[str, str]:
+    env = dict(os.environ, PYTHONPATH=SRC, BOT_TOKEN="1:bench", LOG_LEVEL="WARNING")
+    env.update(extra)
+    return env
+
+
+def import_times() -> tuple[float, list[tuple[float, str]]]:
+    """Суммарное время импорта и самые тяжёлые пакеты верхнего уровня, мс."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_TARGET],
+        env=bot_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0.0
+    packages = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0:
+            total += int(cumulative) / 1000
+        if depth <= 1:
+            packages.append((int(cumulative) / 1000, name.strip()))
+    return total, sorted(packages, reverse=True)
+
+
+async def time_to_first_poll(deadline: float = 30) -> float:
+    first_poll = asyncio.Event()
+
+    def handler(path: str, query: dict, body: bytes) -> object:
+        if path.endswith("/getUpdates"):
+            first_poll.set()
+        return telegram_handler(path, query, body)
+
+    stub = await StubServer(handler).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "hw_food_bot.cli",
+            "polling",
+            env=bot_env(BOT_API_URL=stub.url + "/bot", USER_DB=str(Path(tmp) / "users.db")),
+            stdout=asyncio.subprocess.DEVNULL,
+        )
+        try:
+            await asyncio.wait_for(first_poll.wait(), deadline)
+            return time.perf_counter() - started
+        finally:
+            process.terminate()
+            await process.wait()
+            await stub.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="сколько тяжёлых импортов показать")
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.runs)]
+    print(f"import: {statistics.median(total for total, _ in runs):.0f} ms (median)")
+    for cumulative, name in runs[-1][1][: args.top]:
+        print(f"  {cumulative:8.1f} ms  {name}")
+
+    polls = [asyncio.run(time_to_first_poll()) for _ in range(args.runs)]
+    print(
+        f"first getUpdates: {statistics.median(polls) * 1000:.0f} ms (median), "
+        f"min {min(polls) * 1000:.0f} ms, max {max(polls) * 1000:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Нагрузочный тест: синтетические диалоги через настоящий `Application` бота.
+
+Telegram Bot API, OpenFoodFacts и OpenWeather заменены локальными заглушками
+(`stub_servers.py`) с настраиваемой задержкой. Каждый пользователь проходит
+сценарий /set_profile -> 5 ответов, /log_food -> граммы, /log_food из двух
+продуктов одним сообщением, /log_activity -> кнопка -> минуты, /log_water,
+/check_progress. Апдейты идут через тот же
+`PerChatUpdateProcessor`, что и в проде.
+
+    python benchmarks/load_test.py --users 1000 10000 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from itertools import count
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault("BOT_TOKEN", "1:bench")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from stub_servers import start_stub_servers  # noqa: E402
+from telegram import Update  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+from hw_food_bot import bot  # noqa: E402
+from hw_food_bot.activities import get_catalog  # noqa: E402
+from hw_food_bot.food_api import rate_limit as food_rate_limit  # noqa: E402
+from hw_food_bot.update_processor import PerChatUpdateProcessor  # noqa: E402
+from hw_food_bot.weather_api import rate_limit as weather_rate_limit  # noqa: E402
+
+PRODUCTS = ["банан", "овсянка", "молоко", "гречка", "яблоко", "творог", "курица", "рис"]
+CITIES = ["Moscow, RU", "Saint Petersburg, RU", "Kazan, RU", "Sochi, RU", "Novosibirsk, RU"]
+# первая страница клавиатуры - то, что пользователь видит сразу
+ACTIVITIES = list(get_catalog().pages[0])
+
+
+def user_flow(user_id: int) -> list[str]:
+    """Тексты сообщений одного пользователя в порядке отправки."""
+    return [
+        "/set_profile",
+        str(60 + user_id % 40),
+        str(160 + user_id % 30),
+        str(20 + user_id % 40),
+        str(1 + user_id % 90),
+        CITIES[user_id % len(CITIES)],
+        f"/log_food {PRODUCTS[user_id % len(PRODUCTS)]}",
+        str(50 + user_id % 200),
+        f"/log_food {PRODUCTS[(user_id + 1) % len(PRODUCTS)]} 100, "
+        f"{PRODUCTS[(user_id + 2) % len(PRODUCTS)]} {50 + user_id % 100}",
+        "/log_activity",
+        ACTIVITIES[user_id % len(ACTIVITIES)],
+        str(10 + user_id % 50),
+        f"/log_water {100 + user_id % 400}",
+        "/check_progress",
+    ]
+
+
+_update_ids = count(1)
+
+
+def make_update(application: Application, user_id: int, text: str) -> Update:
+    message = {
+        "message_id": next(_update_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(text.split(" ", 1)[0])}
+        ]
+    return Update.de_json({"update_id": message["message_id"], "message": message}, application.bot)
+
+
+def rss_bytes() -> int:
+    try:
+        with Path("/proc/self/statm").open() as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else 0
+
+
+async def run(n_users: int, args: argparse.Namespace) -> dict:
+    stubs = await start_stub_servers(args.latency)
+    for limiter in (food_rate_limit, weather_rate_limit):
+        # у заглушек нет квот, меряем сам бот
+        limiter.max_rate = args.upstream_rate
+        limiter.time_period = 1
+
+    async def post_init(application: Application) -> None:
+        await bot.post_init(application)
+        # сессия бота поднимается в фоне, а память меряем уже после неё
+        await application.bot_data["http_client"].start()
+        application.bot_data["food_service"].api_url = stubs["food"].url + "/cgi/search.pl"
+        application.bot_data["weather_service"].api_url = stubs["weather"].url + "/weather"
+        # флуд-лимитов у заглушки тоже нет
+        outbox = application.bot_data["outbox"]
+        outbox.global_rate = outbox.chat_rate = outbox.chat_burst = args.upstream_rate
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot.USER_DB = str(Path(tmp) / "users.db")
+        application = (
+            Application.builder()
+            .token(os.environ["BOT_TOKEN"])
+            .base_url(stubs["telegram"].url + "/bot")
+            .concurrent_updates(PerChatUpdateProcessor(args.concurrency))
+            .connection_pool_size(args.concurrency)
+            .persistence(bot.build_persistence())
+            .post_init(post_init)
+            .post_stop(bot.post_stop)
+            .post_shutdown(bot.post_shutdown)
+            .build()
+        )
+        bot.register_handlers(application)
+        await application.initialize()
+        await application.post_init(application)
+        await application.start()
+        processor = application.update_processor
+
+        latencies: list[float] = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def simulate(user_id: int) -> None:
+            async with semaphore:
+                for text in user_flow(user_id):
+                    update = make_update(application, user_id, text)
+                    started = time.perf_counter()
+                    await processor.process_update(update, application.process_update(update))
+                    latencies.append(time.perf_counter() - started)
+
+        gc.collect()
+        rss_before = rss_bytes()
+        started = time.perf_counter()
+        await asyncio.gather(*(simulate(user_id) for user_id in range(1, n_users + 1)))
+        elapsed = time.perf_counter() - started
+        gc.collect()
+        rss_after = rss_bytes()
+
+        await application.stop()
+        await application.post_stop(application)
+        await application.shutdown()
+        await application.post_shutdown(application)
+    for stub in stubs.values():
+        await stub.stop()
+
+    return {
+        "users": n_users,
+        "updates": len(latencies),
+        "updates_per_sec": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "bytes_per_user": (rss_after - rss_before) / n_users,
+        "telegram_calls": stubs["telegram"].requests,
+        "food_calls": stubs["food"].requests,
+        "weather_calls": stubs["weather"].requests,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка заглушек, с")
+    parser.add_argument(
+        "--concurrency", type=int, default=bot.CONCURRENT_UPDATES, help="активных диалогов сразу"
+    )
+    parser.add_argument("--upstream-rate", type=float, default=1000, help="лимит API в секунду")
+    args = parser.parse_args()
+
+    header = (
+        f"{'users':>8} {'updates':>9} {'upd/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'p99 ms':>8} {'B/user':>8} {'tg':>8} {'food':>6} {'weather':>7}"
+    )
+    print(header)
+    for n_users in args.users:
+        r = asyncio.run(run(n_users, args))
+        print(
+            f"{r['users']:>8} {r['updates']:>9} {r['updates_per_sec']:>9.0f} "
+            f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+            f"{r['bytes_per_user']:>8.0f} {r['telegram_calls']:>8} {r['food_calls']:>6} "
+            f"{r['weather_calls']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
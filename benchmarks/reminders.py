@@ -0,0 +1,148 @@
+"""Планировщик напоминаний: память на пользователя и сутки проверок за секунды.
+
+Пользователи с разным прогрессом разбросаны по городам в разных часовых
+поясах. Время не ждётся: `ReminderScheduler.advance` прокручивает кольцо по
+тикам на сутки вперёд, отправка идёт в заглушку без лимита. Меряется память
+кольца (`tracemalloc`), число проверок в секунду и самая долгая пачка - столько
+event loop не достаётся хендлерам.
+
+    python benchmarks/reminders.py --users 100000 1000000
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+import tracemalloc
+from datetime import UTC, datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from hw_food_bot.calories_math import (  # noqa: E402
+    UserManager,
+    UserProfile,
+    UserProgress,
+    WeatherService,
+    compute_goals_batch,
+    local_day,
+)
+from hw_food_bot.rate_limit import InMemoryBackend  # noqa: E402
+from hw_food_bot.reminders import REMINDER_TICK, ReminderScheduler  # noqa: E402
+from hw_food_bot.weather_api import utc_offsets  # noqa: E402
+
+# город и смещение от UTC, с, как их отдаёт OpenWeather
+CITIES = {
+    "Kaliningrad, RU": 2 * 3600,
+    "Moscow, RU": 3 * 3600,
+    "Yekaterinburg, RU": 5 * 3600,
+    "Novosibirsk, RU": 7 * 3600,
+    "Vladivostok, RU": 10 * 3600,
+    "London, GB": 0,
+    "New York, US": -4 * 3600,
+}
+
+
+class Users:
+    """То, что планировщику нужно от `UserStore`, без базы."""
+
+    def __init__(self, users: dict[int, UserManager]):
+        self._users = users
+
+    def user_ids(self) -> list[int]:
+        return list(self._users)
+
+    def peek(self, user_id: int) -> UserManager | None:
+        return self._users.get(user_id)
+
+
+class CountingOutbox:
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> None:
+        self.sent += 1
+
+
+class TimedScheduler(ReminderScheduler):
+    max_batch = 0.0
+
+    async def _check_batch(self, user_ids, now):
+        started = time.perf_counter()
+        sent = await super()._check_batch(user_ids, now)
+        self.max_batch = max(self.max_batch, time.perf_counter() - started)
+        return sent
+
+
+def make_users(n_users: int, weather_service: WeatherService) -> dict[int, UserManager]:
+    cities = list(CITIES)
+    now = datetime.now(UTC)
+    profiles = [
+        UserProfile(60 + i % 40, 160 + i % 30, 20 + i % 40, i % 90, cities[i % len(cities)])
+        for i in range(n_users)
+    ]
+    goals = compute_goals_batch(profiles, [None] * n_users)
+    users = {}
+    for i, (profile, user_goals) in enumerate(zip(profiles, goals, strict=True)):
+        user = UserManager(profile, weather_service, None)
+        user.goals = user_goals
+        user.progress = UserProgress(
+            logged_water=random.randrange(0, int(user_goals.water_goal), 50),
+            day=local_day(CITIES[profile.city], now),
+        )
+        users[i + 1] = user
+    return users
+
+
+async def run(n_users: int) -> dict:
+    utc_offsets.update(CITIES)
+    weather_service = WeatherService(None)
+    users = Users(make_users(n_users, weather_service))
+    outbox = CountingOutbox()
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    scheduler = TimedScheduler(users, weather_service, outbox, rate=1e9, backend=InMemoryBackend())
+    scheduler.add(users.user_ids())
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    now = time.time()
+    for tick in range(1, int(24 * 60 * 60 / REMINDER_TICK) + 1):
+        await scheduler.advance(now + tick * REMINDER_TICK)
+    elapsed = time.perf_counter() - started
+    await scheduler.stop()
+
+    return {
+        "users": n_users,
+        "bytes_per_user": (after - before) / n_users,
+        "checks": scheduler.stats.checked,
+        "checks_per_sec": scheduler.stats.checked / elapsed,
+        "sent": outbox.sent,
+        "max_batch_ms": scheduler.max_batch * 1000,
+        "scheduled": len(scheduler),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[100_000])
+    args = parser.parse_args()
+
+    print(
+        f"{'users':>8} {'B/user':>7} {'checks/day':>11} {'checks/s':>9} "
+        f"{'reminders':>10} {'batch ms':>9} {'scheduled':>10}"
+    )
+    for n_users in args.users:
+        r = asyncio.run(run(n_users))
+        print(
+            f"{r['users']:>8} {r['bytes_per_user']:>7.1f} {r['checks']:>11} "
+            f"{r['checks_per_sec']:>9.0f} {r['sent']:>10} {r['max_batch_ms']:>9.1f} "
+            f"{r['scheduled']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
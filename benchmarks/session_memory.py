@@ -0,0 +1,122 @@
+"""Память на пользователя: активный диалог против брошенного после таймаута.
+
+Каждый пользователь пишет /start и начинает /set_profile, ответив на первый
+вопрос, то есть остаётся посреди диалога. Память (`tracemalloc`) меряется
+дважды: сразу, пока все диалоги активны, и после того, как у всех сработал
+`conversation_timeout` и прошла очистка пустых `user_data`. Таймеры не
+ждутся, а запускаются сразу - ровно то, что сделал бы `JobQueue` через
+`CONVERSATION_TIMEOUT` секунд.
+
+    python benchmarks/session_memory.py --users 100000
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+os.environ.setdefault("BOT_TOKEN", "1:bench")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from load_test import make_update  # noqa: E402
+from stub_servers import StubServer, telegram_handler  # noqa: E402
+from telegram.ext import Application, ConversationHandler  # noqa: E402
+
+from hw_food_bot import bot  # noqa: E402
+from hw_food_bot.sessions import drop_empty_sessions  # noqa: E402
+
+USER_FLOW = ["/start", "/set_profile", "70"]
+
+
+class NullOutbox:
+    """Ответы никуда не уходят: меряется состояние диалогов, а не очередь отправки."""
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> None:
+        pass
+
+
+def conversation_timeouts(application: Application) -> list:
+    return [
+        job
+        for job in application.job_queue.jobs()
+        if isinstance(getattr(job.callback, "__self__", None), ConversationHandler)
+    ]
+
+
+async def snapshot(application: Application, baseline: int, n_users: int) -> dict:
+    await application.update_persistence()
+    # второй проход отпускает задачи записи из первого
+    await application.update_persistence()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    return {
+        "user_data": len(application.user_data),
+        "conversations": len(conversation_timeouts(application)),
+        "bytes_per_user": (current - baseline) / n_users,
+    }
+
+
+async def run(n_users: int) -> dict:
+    stub = await StubServer(telegram_handler).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        bot.USER_DB = str(Path(tmp) / "users.db")
+        application = (
+            Application.builder()
+            .token(os.environ["BOT_TOKEN"])
+            .base_url(stub.url + "/bot")
+            .persistence(bot.build_persistence())
+            .build()
+        )
+        bot.register_handlers(application)
+        application.bot_data["outbox"] = NullOutbox()
+        await application.initialize()
+        await application.start()
+
+        gc.collect()
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        started = time.perf_counter()
+        for user_id in range(1, n_users + 1):
+            for text in USER_FLOW:
+                await application.process_update(make_update(application, user_id, text))
+        elapsed = time.perf_counter() - started
+        active = await snapshot(application, baseline, n_users)
+
+        for job in conversation_timeouts(application):
+            await job.run(application)
+            job.schedule_removal()
+        drop_empty_sessions(application)
+        idle = await snapshot(application, baseline, n_users)
+        tracemalloc.stop()
+
+        await application.stop()
+        await application.shutdown()
+    await stub.stop()
+    return {"users": n_users, "elapsed": elapsed, "active": active, "idle": idle}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[100_000])
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'phase':>7} {'user_data':>10} {'dialogs':>8} {'B/user':>8}")
+    for n_users in args.users:
+        r = asyncio.run(run(n_users))
+        for phase in ("active", "idle"):
+            p = r[phase]
+            print(
+                f"{r['users']:>8} {phase:>7} {p['user_data']:>10} {p['conversations']:>8} "
+                f"{p['bytes_per_user']:>8.0f}"
+            )
+        print(f"{'':>8} {r['elapsed']:.1f}s to feed {r['users'] * len(USER_FLOW)} updates")
+
+
+if __name__ == "__main__":
+    main()
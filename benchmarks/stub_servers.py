@@ -0,0 +1,112 @@
+"""Локальные заглушки Telegram Bot API, OpenFoodFacts и OpenWeather для бенчмарков.
+
+Минимальный HTTP/1.1 сервер на asyncio с keep-alive и настраиваемой задержкой ответа.
+"""
+
+import asyncio
+import json
+import random
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs, urlsplit
+
+Handler = Callable[[str, dict[str, list[str]], bytes], object]
+
+
+@dataclass
+class StubServer:
+    handler: Handler
+    latency: float = 0.0
+    host: str = "127.0.0.1"
+    port: int = 0
+    requests: int = 0
+    _server: asyncio.Server | None = field(default=None, repr=False)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "StubServer":
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                url = urlsplit(target)
+                payload = json.dumps(
+                    self.handler(url.path, parse_qs(url.query), body), ensure_ascii=False
+                ).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def telegram_handler(path: str, query: dict, body: bytes) -> dict:
+    method = path.rsplit("/", 1)[-1]
+    if method == "getMe":
+        result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+    elif method in ("sendMessage", "sendDocument"):
+        # PTB шлёт параметры формой, multipart для файлов не разбираем
+        form = parse_qs(body.decode(errors="ignore")) if method == "sendMessage" else {}
+        data = {key: values[0] for key, values in form.items()}
+        result = {
+            "message_id": random.randint(1, 2**31),
+            "date": 0,
+            "chat": {"id": int(data.get("chat_id", 0)), "type": "private"},
+            "text": data.get("text", ""),
+        }
+    elif method == "getUpdates":
+        result = []
+    else:
+        result = True
+    return {"ok": True, "result": result}
+
+
+def food_handler(path: str, query: dict, body: bytes) -> dict:
+    name = query.get("search_terms", ["?"])[0]
+    return {
+        "count": 2,
+        "page": 1,
+        "products": [
+            {"product_name": name, "nutriments": {"energy-kcal_100g": 0}},
+            {"product_name": name, "nutriments": {"energy-kcal_100g": 89}},
+        ],
+    }
+
+
+def weather_handler(path: str, query: dict, body: bytes) -> dict:
+    return {"main": {"temp": 27.5}, "timezone": 3 * 60 * 60}
+
+
+async def start_stub_servers(latency: float = 0.0) -> dict[str, StubServer]:
+    return {
+        "telegram": await StubServer(telegram_handler, latency).start(),
+        "food": await StubServer(food_handler, latency).start(),
+        "weather": await StubServer(weather_handler, latency).start(),
+    }
@@ -0,0 +1,3 @@
+from hw_food_bot.config import load_env
+
+load_env()
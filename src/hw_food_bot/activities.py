@@ -0,0 +1,127 @@
+"""Каталог активностей с MET и расход калорий с учётом веса.
+
+MET (метаболический эквивалент) из Compendium of Physical Activities лежит в
+`activities.csv`. Каталог читается один раз, а дальше всё готово заранее:
+словарь по имени, индекс по префиксам слов и страницы для клавиатуры.
+"""
+
+import csv
+import difflib
+import functools
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+ACTIVITIES_FILE = Path(__file__).with_name("activities.csv")
+
+# кнопок на странице клавиатуры и результатов поиска
+PAGE_SIZE = 8
+# до какой длины префикса слова строится индекс, дальше - фильтр по startswith
+PREFIX_LEN = 3
+# насколько слово из запроса может отличаться от слова в каталоге
+FUZZY_CUTOFF = 0.75
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.casefold().replace("ё", "е").split())
+
+
+def split_words(text: str) -> tuple[str, ...]:
+    # `мини-футбол` находится и по `футбол`
+    return tuple(re.findall(r"\w+", normalize(text)))
+
+
+@dataclass(frozen=True, slots=True)
+class Activity:
+    name: str
+    met: float
+    category: str
+    words: tuple[str, ...] = field(default=(), compare=False, repr=False)
+
+    def burned_calories(self, weight: float, minutes: float) -> float:
+        """Ккал = MET x вес (кг) x время (ч)."""
+        return self.met * weight * minutes / 60
+
+
+class ActivityCatalog:
+    def __init__(self, activities: list[Activity]):
+        self.activities = activities
+        self._by_name = {normalize(activity.name): activity for activity in activities}
+        self._by_prefix: dict[str, list[Activity]] = defaultdict(list)
+        self._by_word: dict[str, list[Activity]] = defaultdict(list)
+        for activity in activities:
+            for word in activity.words:
+                if activity not in self._by_word[word]:
+                    self._by_word[word].append(activity)
+                for length in range(1, min(len(word), PREFIX_LEN) + 1):
+                    if activity not in self._by_prefix[word[:length]]:
+                        self._by_prefix[word[:length]].append(activity)
+        self._vocabulary = list(self._by_word)
+        self.pages = [
+            tuple(activity.name for activity in activities[start : start + PAGE_SIZE])
+            for start in range(0, len(activities), PAGE_SIZE)
+        ]
+
+    @classmethod
+    def from_csv(cls, path: Path = ACTIVITIES_FILE) -> "ActivityCatalog":
+        with path.open(encoding="utf-8", newline="") as f:
+            return cls(
+                [
+                    Activity(
+                        row["name"],
+                        float(row["met"]),
+                        row["category"],
+                        split_words(row["name"]),
+                    )
+                    for row in csv.DictReader(f)
+                ]
+            )
+
+    def __len__(self) -> int:
+        return len(self.activities)
+
+    def get(self, name: str) -> Activity | None:
+        return self._by_name.get(normalize(name))
+
+    # каталог один на процесс, так что кэш на методе не мешает сборке мусора
+    @functools.lru_cache(maxsize=1024)
+    def search(self, query: str, limit: int = PAGE_SIZE) -> tuple[Activity, ...]:
+        """Активности, в которых каждое слово запроса - начало какого-то слова.
+
+        Если так ничего не нашлось, слова запроса исправляются на похожие из
+        каталога (опечатки), а результаты упорядочены по числу совпавших слов.
+        """
+        query_words = split_words(query)
+        if not query_words:
+            return ()
+        if (exact := self.get(query)) is not None:
+            return (exact,)
+
+        candidates = self._by_prefix.get(query_words[0][:PREFIX_LEN], ())
+        found = [
+            activity
+            for activity in candidates
+            if all(
+                any(word.startswith(query_word) for word in activity.words)
+                for query_word in query_words
+            )
+        ]
+        if found:
+            return tuple(found[:limit])
+
+        scores: dict[Activity, int] = {}
+        for query_word in query_words:
+            for word in difflib.get_close_matches(
+                query_word, self._vocabulary, n=3, cutoff=FUZZY_CUTOFF
+            ):
+                for activity in self._by_word[word]:
+                    scores[activity] = scores.get(activity, 0) + 1
+        ranked = sorted(scores, key=scores.__getitem__, reverse=True)
+        return tuple(ranked[:limit])
+
+
+@functools.cache
+def get_catalog() -> ActivityCatalog:
+    """Общий на процесс каталог, читается при первом обращении."""
+    return ActivityCatalog.from_csv()
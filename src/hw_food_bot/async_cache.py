@@ -0,0 +1,193 @@
+"""Асинхронный кэш результатов корутин с TTL, LRU, single-flight и stale-while-revalidate."""
+
+import asyncio
+import functools
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# все кэши, созданные через `async_cached`, для метрик
+caches: list["AsyncTTLCache"] = []
+
+# после скольких попаданий ключ считается горячим и обновляется заранее
+HOT_HITS = 2
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    coalesced: int = 0
+    stale: int = 0
+    refreshes: int = 0
+
+
+@dataclass(slots=True)
+class _Entry:
+    value: Any
+    expires_at: float
+    stale_until: float
+    hits: int = 0
+
+
+class AsyncTTLCache:
+    """Кэш результатов (а не корутин) с вытеснением по LRU.
+
+    Одновременные промахи по одному ключу объединяются в один запрос к источнику.
+    Пустые результаты (по умолчанию `None`) живут `negative_ttl` секунд, остальные - `ttl`.
+
+    Ещё `stale_ttl` секунд после истечения значение отдаётся сразу, а свежее
+    загружается в фоне: если источник лежит, пользователь получает старое значение
+    вместо ошибки. Горячие ключи перезагружаются в фоне заранее, когда до
+    истечения остаётся меньше `refresh_ahead` от `ttl`.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        maxsize: int = 1024,
+        ttl: float = 60 * 60,
+        *,
+        negative_ttl: float = 60,
+        name: str = "cache",
+        negative: Callable[[Any], bool] | None = None,
+        stale_ttl: float = 0,
+        refresh_ahead: float = 0,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_ahead = refresh_ahead
+        self.negative = negative or (lambda value: value is None)
+        self.name = name
+        self.stats = CacheStats()
+        self._data: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        """Вернуть (найдено, значение) без обращения к источнику."""
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        now = time.monotonic()
+        if entry.expires_at <= now:
+            if entry.stale_until <= now:
+                del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, entry.value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        if self.negative(value):
+            # пустой результат не стоит отдавать после истечения
+            expires_at = stale_until = now + self.negative_ttl
+        else:
+            expires_at = now + self.ttl
+            stale_until = expires_at + self.stale_ttl
+        self._data[key] = _Entry(value, expires_at, stale_until)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._data.get(key)
+        if entry is not None:
+            now = time.monotonic()
+            if entry.expires_at > now:
+                self.stats.hits += 1
+                entry.hits += 1
+                self._data.move_to_end(key)
+                if (
+                    entry.hits >= HOT_HITS
+                    and entry.expires_at - now < self.ttl * self.refresh_ahead
+                    and key not in self._inflight
+                ):
+                    self.stats.refreshes += 1
+                    self._load(key, loader)
+                return entry.value
+            if entry.stale_until > now:
+                self.stats.stale += 1
+                self._data.move_to_end(key)
+                if key not in self._inflight:
+                    self._load(key, loader)
+                return entry.value
+            del self._data[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats.misses += 1
+            task = self._load(key, loader)
+        else:
+            self.stats.coalesced += 1
+        # shield: отмена одного ожидающего не должна отменять общий запрос
+        return await asyncio.shield(task)
+
+    def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = asyncio.ensure_future(loader())
+        self._inflight[key] = task
+        task.add_done_callback(functools.partial(self._on_loaded, key))
+        return task
+
+    def _on_loaded(self, key: Hashable, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.debug("%s: loader for %r failed, result not cached", self.name, key)
+            return
+        self.set(key, task.result())
+
+
+def async_cached(  # noqa: PLR0913
+    maxsize: int = 1024,
+    ttl: float = 60 * 60,
+    *,
+    negative_ttl: float = 60,
+    key: Callable[..., Hashable] | None = None,
+    negative: Callable[[Any], bool] | None = None,
+    stale_ttl: float = 0,
+    refresh_ahead: float = 0,
+):
+    """Декоратор для `async def`, кэширующий результат через `AsyncTTLCache`.
+
+    Сам кэш доступен как атрибут `.cache` у обёрнутой функции.
+    """
+
+    def decorator(func):
+        cache = AsyncTTLCache(
+            maxsize,
+            ttl,
+            negative_ttl=negative_ttl,
+            name=func.__qualname__,
+            negative=negative,
+            stale_ttl=stale_ttl,
+            refresh_ahead=refresh_ahead,
+        )
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            return await cache.get_or_load(cache_key, lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        caches.append(cache)
+        return wrapper
+
+    return decorator
@@ -1,14 +1,16 @@
 """Telegram bot logic"""
 
+import asyncio
+import functools
 import inspect
 import logging
 import os
+import re
+from dataclasses import dataclass
 from typing import Any
 
-from dotenv import find_dotenv, load_dotenv
-from pydantic.dataclasses import dataclass
 from telegram import ReplyKeyboardMarkup, Update
-from telegram.constants import ParseMode
+from telegram.constants import FileSizeLimit, ParseMode
 from telegram.ext import (
     Application,
     CallbackContext,
@@ -18,29 +20,123 @@ from telegram.ext import (
     filters,
 )
 
-from hw_food_bot.calories_math import ACTIVITIES_1M_CAL_BURN, UserManager, UserProfile
+from hw_food_bot.activities import get_catalog
+from hw_food_bot.calories_math import (
+    FoodService,
+    UserManager,
+    UserProfile,
+    WeatherService,
+)
+from hw_food_bot.day_rollover import schedule_day_rollover
+from hw_food_bot.export import ExportFormat, ExportKind, ExportUnavailable, export_file
+from hw_food_bot.food_index import FoodIndex
+from hw_food_bot.http_client import HttpClient, HttpClientConfig
+from hw_food_bot.loop_watchdog import LoopWatchdog
+from hw_food_bot.metrics import instrument_handlers, start_metrics_server
 from hw_food_bot.motivation import get_random_quote
+from hw_food_bot.outbox import MessageDispatcher
+from hw_food_bot.persistence import SQLitePersistence
+from hw_food_bot.profiling import install_sampler
+from hw_food_bot.reminders import REMINDERS, ReminderScheduler
+from hw_food_bot.sessions import (
+    CONVERSATION_TIMEOUT,
+    end_session,
+    schedule_session_sweep,
+    timeout_handlers,
+)
 from hw_food_bot.setup_logging import setup_logging
+from hw_food_bot.sharding import Shard
+from hw_food_bot.storage import HISTORY_PAGE_SIZE, UserStore
+from hw_food_bot.update_processor import PerChatUpdateProcessor
+from hw_food_bot.weather_refresh import schedule_weather_refresh
 
 log_level = os.getenv("LOG_LEVEL", "INFO")
-setup_logging(log_level)
+# json - структурные логи, которые пишутся пачками из отдельного потока
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# оставлять каждую N-ю DEBUG-запись с одного места
+LOG_DEBUG_SAMPLE = int(os.getenv("LOG_DEBUG_SAMPLE", "1"))
+setup_logging(log_level, LOG_FORMAT, LOG_DEBUG_SAMPLE)
 
+logger = logging.getLogger(__name__)
 
-load_dotenv(find_dotenv())
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
-
-# Хранилище данных пользователей
-users: dict[str, UserManager] = {}
-FOOD_GRAMS = range(1)
+# свой сервер Bot API (или заглушка в бенчмарках) вместо api.telegram.org
+BOT_API_URL = os.environ.get("BOT_API_URL")
+USER_DB = os.environ.get("USER_DB", "users.db")
+FOOD_INDEX = os.environ.get("FOOD_INDEX")
+# сколько апдейтов разных чатов обрабатывать одновременно
+CONCURRENT_UPDATES = int(os.environ.get("CONCURRENT_UPDATES", "64"))
+# порт локального /metrics, без него метрики не отдаются
+METRICS_PORT = os.environ.get("METRICS_PORT")
+PROFILE_SAMPLING_HZ = float(os.environ.get("PROFILE_SAMPLING_HZ", "100"))
+PROFILE_ON_START = os.environ.get("PROFILE_ON_START", "0") == "1"
+PROFILE_OUTPUT = os.environ.get("PROFILE_OUTPUT", "profile.folded")
+# порог блокировки event loop'а в мс, после которого пишется стек
+WATCHDOG_THRESHOLD_MS = os.environ.get("WATCHDOG_THRESHOLD_MS")
+# кому доступна выгрузка по всем пользователям, id через запятую
+ADMIN_IDS = {int(i) for i in os.environ.get("ADMIN_IDS", "").split(",") if i.strip()}
+
+FOOD_GRAMS = 0
 CHOOSING_ACTIVITY, ENTERING_MINUTES = range(1, 3)
+PREV_PAGE, NEXT_PAGE = "« назад", "ещё »"
+# ключи `user_data`, которые живут только пока идёт диалог
+FOOD_KEYS = ("food_name",)
+ACTIVITY_KEYS = ("activity_page", "chosen_activity")
+# название продукта хранится до ответа с граммами, длиннее оно не бывает
+MAX_FOOD_NAME = 100
+
+MEAL_ITEM = re.compile(
+    r"(?P<name>.+?)\s+(?P<grams>-?\d+(?:[.,]\d+)?)\s*(?:г|гр|g)?\.?", re.IGNORECASE
+)
+# запятая между цифрами - десятичная, а не разделитель продуктов
+MEAL_SEPARATOR = re.compile(r"[;\n]|(?<!\d),|,(?!\d)")
 
 
 def get_command_args(text: str) -> str:
     return text.split(" ", 1)[1]
 
 
+def parse_meal(text: str) -> list[tuple[str, float]] | None:
+    """`овсянка 80, банан 120,5` -> [("овсянка", 80), ("банан", 120.5)].
+
+    None, если это один продукт без граммов: их спросят следующим сообщением.
+    `ValueError` с текстом для пользователя, если граммы указаны не у всех
+    продуктов или не больше нуля.
+    """
+    items = []
+    missing = []
+    for part in filter(None, (part.strip() for part in MEAL_SEPARATOR.split(text))):
+        match = MEAL_ITEM.fullmatch(part)
+        if match is None:
+            missing.append(part)
+            continue
+        grams = float(match["grams"].replace(",", "."))
+        if grams <= 0:
+            raise ValueError(f"Количество граммов должно быть больше нуля: {part}")
+        items.append((match["name"], grams))
+    if len(missing) == 1 and not items:
+        return None
+    if missing:
+        raise ValueError(
+            f"Не указаны граммы: {', '.join(missing)}. Пример: /log_food банан 120, яблоко 150"
+        )
+    return items or None
+
+
+async def reply(update: Update, context: CallbackContext, text: str, **kwargs: Any) -> None:
+    """Ответить в чат апдейта через общий `MessageDispatcher`, не дожидаясь доставки."""
+    await context.bot_data["outbox"].send(update.effective_chat.id, text, **kwargs)
+
+
+def get_user_store(context: CallbackContext) -> UserStore:
+    """Хранилище данных пользователей"""
+    return context.bot_data["user_store"]
+
+
 async def start(update: Update, context: CallbackContext):
-    await update.message.reply_text(
+    await reply(
+        update,
+        context,
         f"Привет, {update.effective_user.first_name}!\n"
         "Я помогу вам рассчитать дневные нормы воды и калорий, "
         "а также отслеживать питание и тренировки.\n"
@@ -104,9 +200,11 @@ class ProfileSetup:
         )
 
         if not is_valid:
-            await update.message.reply_text(
-                f"Пожалуйста, введите корректное значение для {field.name}."
+            # уйдёт одним сообщением вместе с повтором вопроса
+            await reply(
+                update, context, f"Пожалуйста, введите корректное значение для {field.name}."
             )
+            await reply(update, context, field.prompt)
             return current_state
 
         context.user_data[field.name] = value
@@ -116,13 +214,23 @@ class ProfileSetup:
             return ConversationHandler.END
 
         next_field = ProfileSetup.FIELDS[field.next_state]
-        await update.message.reply_text(next_field.prompt)
+        await reply(update, context, next_field.prompt)
         return field.next_state
 
+    @staticmethod
+    def field_handler(state: int):
+        """Колбэк для состояния `state` с именем поля, чтобы его было видно в метриках."""
+
+        async def handle(update: Update, context: CallbackContext) -> int:
+            return await ProfileSetup.handle_profile_field(update, context, state)
+
+        handle.__name__ = f"profile_{ProfileSetup.FIELDS[state].name}"
+        return handle
+
     @staticmethod
     async def start_profile_setup(update: Update, context: CallbackContext) -> int:
         first_field = ProfileSetup.FIELDS[ProfileSetup.WEIGHT]
-        await update.message.reply_text(first_field.prompt)
+        await reply(update, context, first_field.prompt)
         return ProfileSetup.WEIGHT
 
     @staticmethod
@@ -135,118 +243,218 @@ class ProfileSetup:
                 age=context.user_data["age"],
                 activity_min=context.user_data["activity"],
                 city=context.user_data["city"],
-            )
+            ),
+            weather_service=context.bot_data["weather_service"],
+            food_service=context.bot_data["food_service"],
         )
-        users[user_id] = user
+        is_new = await get_user_store(context).get(user_id) is None
+        await get_user_store(context).put(user_id, user)
+        if is_new and "reminders" in context.bot_data:
+            context.bot_data["reminders"].add([user_id])
+        # ответы нужны только до сохранения профиля
+        end_session(context, user_id, PROFILE_KEYS)
 
         profile_summary = user.get_progress()
 
-        await update.message.reply_text(
+        await reply(
+            update,
+            context,
             f"Профиль успешно настроен!\nПрогресс:\n{profile_summary}",
             parse_mode=ParseMode.HTML,
         )
 
 
+PROFILE_KEYS = tuple(field.name for field in ProfileSetup.FIELDS.values())
+
+
 def create_profile_handler() -> ConversationHandler:
     """Хендлер для /setup_profile"""
+    states = {
+        state: [MessageHandler(filters.TEXT & ~filters.COMMAND, ProfileSetup.field_handler(state))]
+        for state in ProfileSetup.FIELDS
+    }
+    states[ConversationHandler.TIMEOUT] = timeout_handlers("profile", PROFILE_KEYS)
     return ConversationHandler(
         entry_points=[CommandHandler("set_profile", ProfileSetup.start_profile_setup)],
-        states={
-            state: [
-                MessageHandler(
-                    filters.TEXT & ~filters.COMMAND,
-                    lambda u, c, s=state: ProfileSetup.handle_profile_field(u, c, s),
-                )
-            ]
-            for state in ProfileSetup.FIELDS
-        },
-        fallbacks=[CommandHandler("cancel", cancel)],
+        states=states,
+        fallbacks=[cancel_handler(PROFILE_KEYS)],
+        name="profile",
+        persistent=True,
+        conversation_timeout=CONVERSATION_TIMEOUT or None,
     )
 
 
 async def log_water(update: Update, context: CallbackContext):
     """Залоггировать воду одной командой."""
     user_id = update.effective_user.id
-    if user_id not in users:
-        await update.message.reply_text(
-            "Пожалуйста, настройте профиль с помощью команды /set_profile."
+    user = await get_user_store(context).get(user_id)
+    if user is None:
+        await reply(
+            update, context, "Пожалуйста, настройте профиль с помощью команды /set_profile."
         )
         return
 
     try:
         amount = int(get_command_args(update.message.text))
     except (IndexError, ValueError):
-        await update.message.reply_text("Использование: /log_water <объем> мл")
+        await reply(update, context, "Использование: /log_water <объем> мл")
         return
 
-    output = users[user_id].log_water(amount)
-    await update.message.reply_text(output)
+    output = user.log_water(amount)
+    get_user_store(context).mark_dirty(user_id)
+    await reply(update, context, output)
 
 
 async def log_food_start(update: Update, context: CallbackContext):
-    """Спросить, сколько еды съели"""
-    logging.debug("start logging food")
+    """Спросить, сколько еды съели, или сразу залоггировать `/log_food овсянка 80, банан 120`"""
+    logger.debug("start logging food")
     user_id = update.effective_user.id
-    if user_id not in users:
-        await update.message.reply_text(
-            "Пожалуйста, настройте профиль с помощью команды /set_profile."
+    user = await get_user_store(context).get(user_id)
+    if user is None:
+        await reply(
+            update, context, "Пожалуйста, настройте профиль с помощью команды /set_profile."
         )
         return ConversationHandler.END
-    context.user_data["food_name"] = get_command_args(update.message.text)
-    await update.message.reply_text(f"Сколько грамм вы съели {context.user_data['food_name']}?")
+    try:
+        food_args = get_command_args(update.message.text)
+    except IndexError:
+        await reply(update, context, "Использование: /log_food <продукт> [граммы], ...")
+        return ConversationHandler.END
+
+    try:
+        items = parse_meal(food_args)
+    except ValueError as e:
+        await reply(update, context, str(e))
+        return ConversationHandler.END
+    if items is not None:
+        response = await user.log_foods(items)
+        get_user_store(context).mark_dirty(user_id)
+        await reply(update, context, response)
+        return ConversationHandler.END
+
+    context.user_data["food_name"] = food_args[:MAX_FOOD_NAME]
+    await reply(update, context, f"Сколько грамм вы съели {context.user_data['food_name']}?")
     return FOOD_GRAMS
 
 
 async def log_food_grams(update: Update, context: CallbackContext):
     """Залоггировать объем еды и найти калорийность."""
     user_id = update.effective_user.id
-    food_name = context.user_data["food_name"]
     try:
-        grams = float(update.message.text)
-        response = await users[user_id].log_food(food_name, grams)
-
-        await update.message.reply_text(response)
-    except Exception as e:
-        await update.message.reply_text("Не удалось обработать запрос. Попробуйте ещё раз.")
-        print(e)
+        grams = float(update.message.text.replace(",", "."))
+    except ValueError:
+        grams = 0
+    if not grams > 0:
+        await reply(update, context, "Введите количество граммов - число больше нуля.")
+        return FOOD_GRAMS
+    food_name = context.user_data.get("food_name", "")
+    end_session(context, user_id, FOOD_KEYS)
+    try:
+        user = await get_user_store(context).get(user_id)
+        response = await user.log_food(food_name, grams)
+        get_user_store(context).mark_dirty(user_id)
+
+        await reply(update, context, response)
+    except Exception:
+        logger.exception("failed to log %r grams of %r", update.message.text, food_name)
+        await reply(update, context, "Не удалось обработать запрос. Попробуйте ещё раз.")
     return ConversationHandler.END
 
 
-async def cancel(update: Update, context: CallbackContext):
-    """Завершить текущий conversion как fallback."""
-    await update.message.reply_text("Отменено.")
-    return ConversationHandler.END
+def cancel_handler(keys: tuple[str, ...]) -> CommandHandler:
+    """/cancel для диалога, который хранит в `user_data` ключи `keys`."""
+
+    async def cancel(update: Update, context: CallbackContext):
+        """Завершить текущий conversion как fallback."""
+        end_session(context, update.effective_user.id, keys)
+        await reply(update, context, "Отменено.")
+        return ConversationHandler.END
+
+    return CommandHandler("cancel", cancel)
 
 
-def create_activity_buttons():
-    buttons = [[activity] for activity in ACTIVITIES_1M_CAL_BURN]
+@functools.lru_cache(maxsize=1024)
+def create_activity_buttons(
+    names: tuple[str, ...], navigation: tuple[str, ...] = ()
+) -> ReplyKeyboardMarkup:
+    """Клавиатура из активностей по две в ряд, одна на каждый набор кнопок."""
+    buttons = [list(names[i : i + 2]) for i in range(0, len(names), 2)]
+    if navigation:
+        buttons.append(list(navigation))
     return ReplyKeyboardMarkup(buttons, resize_keyboard=True, one_time_keyboard=True)
 
 
+@functools.cache
+def activity_page_buttons(page: int) -> ReplyKeyboardMarkup:
+    pages = get_catalog().pages
+    navigation = []
+    if page > 0:
+        navigation.append(PREV_PAGE)
+    if page < len(pages) - 1:
+        navigation.append(NEXT_PAGE)
+    return create_activity_buttons(pages[page], tuple(navigation))
+
+
 async def start_log_activity(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
-    if user_id not in users:
-        await update.message.reply_text(
-            "Пожалуйста, настройте профиль с помощью команды /set_profile."
+    user = await get_user_store(context).get(user_id)
+    if user is None:
+        await reply(
+            update, context, "Пожалуйста, настройте профиль с помощью команды /set_profile."
         )
         return ConversationHandler.END
 
-    await update.message.reply_text(
-        "Выберите активность:",
-        reply_markup=create_activity_buttons(),
+    context.user_data["activity_page"] = 0
+    await reply(
+        update,
+        context,
+        "Выберите активность или напишите её название:",
+        reply_markup=activity_page_buttons(0),
     )
     return CHOOSING_ACTIVITY
 
 
 async def process_activity_choice(update: Update, context: CallbackContext):
-    activity = update.message.text
-
-    if activity not in ACTIVITIES_1M_CAL_BURN:
-        await update.message.reply_text("Пожалуйста, выберите активность из предложенного списка.")
+    """Кнопка из каталога, листание страниц или поиск по названию."""
+    text = update.message.text
+    catalog = get_catalog()
+
+    if text in (PREV_PAGE, NEXT_PAGE):
+        page = context.user_data.get("activity_page", 0) + (1 if text == NEXT_PAGE else -1)
+        page = min(max(page, 0), len(catalog.pages) - 1)
+        context.user_data["activity_page"] = page
+        await reply(
+            update,
+            context,
+            f"Страница {page + 1} из {len(catalog.pages)}:",
+            reply_markup=activity_page_buttons(page),
+        )
         return CHOOSING_ACTIVITY
 
-    context.user_data["chosen_activity"] = activity
-    await update.message.reply_text(f"Сколько минут вы занимались активностью '{activity}'?")
+    activity = catalog.get(text)
+    if activity is None:
+        found = catalog.search(text)
+        if not found:
+            await reply(
+                update,
+                context,
+                "Ничего не нашлось. Выберите активность из списка или напишите иначе.",
+                reply_markup=activity_page_buttons(context.user_data.get("activity_page", 0)),
+            )
+            return CHOOSING_ACTIVITY
+        if len(found) > 1:
+            await reply(
+                update,
+                context,
+                "Нашлось несколько активностей, выберите одну:",
+                reply_markup=create_activity_buttons(tuple(a.name for a in found)),
+            )
+            return CHOOSING_ACTIVITY
+        activity = found[0]
+
+    context.user_data.pop("activity_page", None)
+    context.user_data["chosen_activity"] = activity.name
+    await reply(update, context, f"Сколько минут вы занимались активностью '{activity.name}'?")
     return ENTERING_MINUTES
 
 
@@ -255,37 +463,147 @@ async def process_minutes(update: Update, context: CallbackContext):
     try:
         minutes = int(update.message.text)
         if minutes <= 0:
-            await update.message.reply_text("Пожалуйста, введите положительное число минут.")
+            await reply(update, context, "Пожалуйста, введите положительное число минут.")
             return ENTERING_MINUTES
 
         activity = context.user_data.get("chosen_activity")
         user_id = update.effective_user.id
 
-        response = users[user_id].log_activity(activity, minutes)
+        user = await get_user_store(context).get(user_id)
+        response = user.log_activity(activity, minutes)
+        get_user_store(context).mark_dirty(user_id)
+        end_session(context, user_id, ACTIVITY_KEYS)
 
-        await update.message.reply_text(response)
+        await reply(update, context, response)
         return ConversationHandler.END
 
     except ValueError:
-        await update.message.reply_text("Пожалуйста, введите корректное число минут.")
+        await reply(update, context, "Пожалуйста, введите корректное число минут.")
         return ENTERING_MINUTES
 
 
 async def check_progress(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
-    if user_id not in users:
-        await update.message.reply_text(
-            "Пожалуйста, настройте профиль с помощью команды /set_profile."
+    user = await get_user_store(context).get(user_id)
+    if user is None:
+        await reply(
+            update, context, "Пожалуйста, настройте профиль с помощью команды /set_profile."
         )
         return
 
-    progress = users[user_id].get_progress()
-    await update.message.reply_text(progress, parse_mode=ParseMode.HTML)
+    progress = user.get_progress()
+    await reply(update, context, progress, parse_mode=ParseMode.HTML)
+
+
+async def history(update: Update, context: CallbackContext):
+    """Итоги по дням, страницами по неделе: /history [страница]"""
+    user_id = update.effective_user.id
+    user_store = get_user_store(context)
+    user = await user_store.get(user_id)
+    if user is None:
+        await reply(
+            update, context, "Пожалуйста, настройте профиль с помощью команды /set_profile."
+        )
+        return
+
+    try:
+        page = int(get_command_args(update.message.text)) - 1
+    except IndexError:
+        page = 0
+    except ValueError:
+        await reply(update, context, "Использование: /history <страница>")
+        return
+
+    days = await user_store.get_history(user_id, max(page, 0))
+    if not days:
+        await reply(update, context, "История пуста.")
+        return
+
+    total_pages = -(-(await user_store.count_history_days(user_id)) // HISTORY_PAGE_SIZE)
+    lines = [
+        f"<b>{day.day}</b>: вода {day.water:.0f} мл, "
+        f"съедено {day.calories_in:.0f} ккал, сожжено {day.calories_burned:.0f} ккал"
+        for day in days
+    ]
+    lines.append(f"Страница {max(page, 0) + 1} из {total_pages}")
+    await reply(update, context, "\n".join(lines), parse_mode=ParseMode.HTML)
+
+
+async def export(update: Update, context: CallbackContext):
+    """Выгрузка файлом: /export [events|days|weeks|months] [csv|parquet] [all]"""
+    user_id = update.effective_user.id
+    user_store = get_user_store(context)
+    kind, fmt, everyone = ExportKind.EVENTS, ExportFormat.CSV, False
+    for arg in update.message.text.split()[1:]:
+        if arg in ExportKind:
+            kind = ExportKind(arg)
+        elif arg in ExportFormat:
+            fmt = ExportFormat(arg)
+        elif arg == "all":
+            everyone = True
+        else:
+            await reply(
+                update, context, "Использование: /export [events|days|weeks|months] [csv|parquet]"
+            )
+            return
+
+    if everyone and user_id not in ADMIN_IDS:
+        await reply(update, context, "Выгрузка по всем пользователям доступна только админам.")
+        return
+    if not everyone and await user_store.get(user_id) is None:
+        await reply(
+            update, context, "Пожалуйста, настройте профиль с помощью команды /set_profile."
+        )
+        return
+
+    # события последних секунд ещё в памяти
+    await user_store.flush()
+    try:
+        path, rows = await export_file(
+            user_store.path, kind, fmt, user_id=None if everyone else user_id
+        )
+    except ExportUnavailable:
+        await reply(update, context, "Parquet сейчас недоступен, попробуйте /export csv.")
+        return
+
+    size = (await asyncio.to_thread(path.stat)).st_size
+    if rows == 0 or size > FileSizeLimit.FILESIZE_UPLOAD:
+        await asyncio.to_thread(path.unlink)
+        text = "Выгружать пока нечего." if rows == 0 else "Файл больше лимита Telegram в 50 МБ."
+        await reply(update, context, text)
+        return
+    await context.bot_data["outbox"].send_document(
+        update.effective_chat.id, path, caption=f"{kind}: {rows} строк", filename=f"{kind}.{fmt}"
+    )
+
+
+def reminders_muted(application: Application, user_id: int) -> bool:
+    # `get` у `user_data` не создаёт пустую запись пользователя
+    return application.user_data.get(user_id, {}).get("reminders") is False
+
+
+async def reminders(update: Update, context: CallbackContext):
+    """Напоминания о воде: /reminders [on|off]"""
+    user_id = update.effective_user.id
+    args = update.message.text.split()[1:]
+    if args == ["off"]:
+        context.user_data["reminders"] = False
+        await reply(update, context, "Напоминания о воде выключены.")
+    elif args == ["on"]:
+        end_session(context, user_id, ("reminders",))
+        await reply(update, context, "Напоминания о воде включены.")
+    elif not args:
+        state = "выключены" if reminders_muted(context.application, user_id) else "включены"
+        await reply(
+            update, context, f"Напоминания о воде {state}. Использование: /reminders on|off"
+        )
+    else:
+        await reply(update, context, "Использование: /reminders on|off")
 
 
 async def motivation(update: Update, context: CallbackContext):
     """Доля мотивации"""
-    await update.message.reply_text(f"<i>{get_random_quote()}</i>", parse_mode=ParseMode.HTML)
+    await reply(update, context, f"<i>{await get_random_quote()}</i>", parse_mode=ParseMode.HTML)
 
 
 async def help(update: Update, context: CallbackContext):
@@ -295,15 +613,18 @@ async def help(update: Update, context: CallbackContext):
         - /start - Начать общение
         - /set_profile - Создать профиль с физическими характеристиками
         - /check_progress - Посмотреть текущий прогресс
+        - /history - История по дням (/history 2 - предыдущая неделя)
+        - /export - Выгрузить историю файлом (/export days csv - итоги по дням)
         - /log_water - Залоггировать воду
-        - /log_food - Залоггировать еду
-        - /log_activity - Залоггировать активность
+        - /log_food - Залоггировать еду (/log_food овсянка 80, банан 120 - сразу несколько)
+        - /log_activity - Залоггировать активность (можно написать название: бег, плавание...)
+        - /reminders - Включить или выключить напоминания о воде (/reminders off)
         - /motivation - Получить дозу кринжовой мотивации
         - /cancel - Отменить текущую команду (если есть коммуникация)
         - /help - Получить справку
         """
     )
-    await update.message.reply_text(help_text)
+    await reply(update, context, help_text)
 
 
 def create_activity_handler() -> ConversationHandler:
@@ -314,8 +635,12 @@ def create_activity_handler() -> ConversationHandler:
                 MessageHandler(filters.TEXT & ~filters.COMMAND, process_activity_choice)
             ],
             ENTERING_MINUTES: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_minutes)],
+            ConversationHandler.TIMEOUT: timeout_handlers("activity", ACTIVITY_KEYS),
         },
-        fallbacks=[CommandHandler("cancel", cancel)],
+        fallbacks=[cancel_handler(ACTIVITY_KEYS)],
+        name="activity",
+        persistent=True,
+        conversation_timeout=CONVERSATION_TIMEOUT or None,
     )
 
 
@@ -324,31 +649,132 @@ def create_food_handler() -> ConversationHandler:
         entry_points=[CommandHandler("log_food", log_food_start)],
         states={
             FOOD_GRAMS: [MessageHandler(filters.TEXT & ~filters.COMMAND, log_food_grams)],
+            ConversationHandler.TIMEOUT: timeout_handlers("food", FOOD_KEYS),
         },
-        fallbacks=[CommandHandler("cancel", cancel)],
+        fallbacks=[cancel_handler(FOOD_KEYS)],
+        name="food",
+        persistent=True,
+        conversation_timeout=CONVERSATION_TIMEOUT or None,
     )
 
 
 async def default_fallback(update: Update, context: CallbackContext):
-    quote = get_random_quote()
+    quote = await get_random_quote()
     text = (
         "Такой команды нет. Для помощи обратитесь в /help.\nНо вот цитата все равно:\n"
         f"<i>{quote}</i>"
     )
-    await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+    await reply(update, context, text, parse_mode=ParseMode.HTML)
 
 
-if __name__ == "__main__":
-    application = Application.builder().token(BOT_TOKEN).build()
+async def post_init(application: Application) -> None:
+    """Поднять общие для всех хендлеров ресурсы."""
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
+    # SIGUSR2 включает и выключает сэмплирование стеков
+    application.bot_data["stack_sampler"] = install_sampler(
+        PROFILE_SAMPLING_HZ, PROFILE_OUTPUT, enabled=PROFILE_ON_START
+    )
+    if WATCHDOG_THRESHOLD_MS:
+        watchdog = LoopWatchdog(threshold=float(WATCHDOG_THRESHOLD_MS) / 1000)
+        watchdog.start()
+        application.bot_data["loop_watchdog"] = watchdog
+    http_client = HttpClient(HttpClientConfig.from_env())
+    # сессия поднимается в фоне, чтобы не задерживать первый getUpdates
+    http_client.warm_up()
+    application.bot_data["http_client"] = http_client
+    application.bot_data["outbox"] = MessageDispatcher(application.bot)
+    application.bot_data["weather_service"] = WeatherService(http_client)
+    food_index = FoodIndex(FOOD_INDEX) if FOOD_INDEX else None
+    application.bot_data["food_service"] = FoodService(http_client, food_index=food_index)
+    user_store = UserStore(
+        USER_DB,
+        application.bot_data["weather_service"],
+        application.bot_data["food_service"],
+        shard=application.bot_data.get("shard"),
+    )
+    await user_store.open()
+    await user_store.preload()
+    application.bot_data["user_store"] = user_store
+    schedule_weather_refresh(application)
+    schedule_day_rollover(application)
+    schedule_session_sweep(application)
+    if REMINDERS:
+        scheduler = ReminderScheduler(
+            user_store,
+            application.bot_data["weather_service"],
+            application.bot_data["outbox"],
+            muted=functools.partial(reminders_muted, application),
+        )
+        scheduler.add(user_store.user_ids())
+        scheduler.start()
+        application.bot_data["reminders"] = scheduler
+
+
+async def post_stop(application: Application) -> None:
+    if "reminders" in application.bot_data:
+        await application.bot_data["reminders"].stop()
+    # бот ещё не закрыт: дослать ответы, оставшиеся в очередях
+    await application.bot_data["outbox"].close()
+
 
+async def post_shutdown(application: Application) -> None:
+    await asyncio.to_thread(application.bot_data["stack_sampler"].stop)
+    if "loop_watchdog" in application.bot_data:
+        await application.bot_data["loop_watchdog"].stop()
+    await application.bot_data["user_store"].close()
+    await application.bot_data["http_client"].close()
+    if application.bot_data["food_service"].food_index is not None:
+        application.bot_data["food_service"].food_index.close()
+
+
+def register_handlers(application: Application) -> None:
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("log_water", log_water))
     application.add_handler(create_profile_handler())
     application.add_handler(create_activity_handler())
     application.add_handler(create_food_handler())
     application.add_handler(CommandHandler("check_progress", check_progress))
+    application.add_handler(CommandHandler("history", history))
+    application.add_handler(CommandHandler("export", export))
+    application.add_handler(CommandHandler("reminders", reminders))
     application.add_handler(CommandHandler("help", help))
     application.add_handler(CommandHandler("motivation", motivation))
     application.add_handler(MessageHandler(filters.ALL, default_fallback))
+    instrument_handlers(application)
+
+
+def build_persistence(shard: Shard | None = None) -> SQLitePersistence:
+    """Состояния диалогов и `user_data` лежат в той же базе, что и пользователи."""
+    # таймеры диалогов не переживают перезапуск, так что старые диалоги не поднимаются
+    return SQLitePersistence(USER_DB, shard=shard, conversation_ttl=CONVERSATION_TIMEOUT or None)
+
+
+def build_application(
+    concurrent_updates: int = CONCURRENT_UPDATES, shard: Shard | None = None
+) -> Application:
+    """Собрать приложение со всеми хендлерами, без запуска получения апдейтов.
+
+    Воркеру (`shard`) Updater не нужен: апдейты ему присылает фронт.
+    """
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(PerChatUpdateProcessor(concurrent_updates))
+        .persistence(build_persistence(shard))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if BOT_API_URL:
+        builder = builder.base_url(BOT_API_URL)
+    if shard is not None:
+        builder = builder.updater(None)
+    application = builder.build()
+    application.bot_data["shard"] = shard
+    register_handlers(application)
+    return application
 
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+if __name__ == "__main__":
+    build_application().run_polling(allowed_updates=Update.ALL_TYPES)
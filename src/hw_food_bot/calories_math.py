@@ -1,18 +1,24 @@
-from pydantic.dataclasses import dataclass
+import asyncio
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
 
-from hw_food_bot.food_api import FoodInfo, get_food_info
-from hw_food_bot.weather_api import get_current_weather
+from hw_food_bot.activities import get_catalog
+from hw_food_bot.food_api import FOOD_API_URL, FoodInfo, get_food_info, search_food
+from hw_food_bot.food_index import FoodIndex
+from hw_food_bot.http_client import HttpClient
+from hw_food_bot.offload import run_blocking
+from hw_food_bot.rate_limit import Priority, RateLimitExceeded
+from hw_food_bot.resilience import UpstreamUnavailable
+from hw_food_bot.weather_api import WEATHER_API_URL, get_current_weather, utc_offsets
 
-ACTIVITIES_1M_CAL_BURN = {
-    "бег": 100,
-    "программирование": 99,
-    "прогулка": 60,
-    "активная активность": 150,
-    "неактивная активность": 50,
-}
+# состояние пользователя живёт в памяти для всех активных пользователей,
+# поэтому это компактные dataclass со слотами без валидации pydantic:
+# данные приходят уже проверенными из диалога или из собственной базы
 
 
-@dataclass
+@dataclass(slots=True)
 class UserProfile:
     weight: float
     height: float
@@ -21,32 +27,144 @@ class UserProfile:
     city: str
 
 
-@dataclass
+@dataclass(slots=True)
 class UserDailyGoals:
     water_goal: float
     calories_goal: float
 
 
-@dataclass
+@dataclass(slots=True)
 class UserProgress:
     logged_water: int = 0
     logged_calories: float = 0
     burned_calories: float = 0
+    # местная дата, к которой относится прогресс, пусто - ещё не известна
+    day: str = ""
+
+
+@dataclass(slots=True)
+class LoggedEvent:
+    """Одна запись журнала: вода (мл), еда (г) или активность (мин)."""
+
+    kind: str
+    name: str
+    amount: float
+    calories: float = 0
+    ts: float = field(default_factory=time.time)
+    day: str = ""
+
+
+def local_day(utc_offset: int | None, now: datetime | None = None) -> str:
+    """Местная дата по смещению от UTC в секундах."""
+    now = now or datetime.now(UTC)
+    return (now + timedelta(seconds=utc_offset or 0)).date().isoformat()
+
+
+def compute_goals_batch(
+    profiles: list[UserProfile], temperatures: list[float | None]
+) -> list[UserDailyGoals]:
+    """Формула целей сразу для списка профилей, по колонкам."""
+    weights = [p.weight for p in profiles]
+    heights = [p.height for p in profiles]
+    ages = [p.age for p in profiles]
+    activity = [p.activity_min for p in profiles]
+    water_bonus = [500 if t and t > 25 else 0 for t in temperatures]  # noqa: PLR2004
+
+    water_goals = [
+        w * 30 + (a / 30 * 500) + b for w, a, b in zip(weights, activity, water_bonus, strict=True)
+    ]
+    calorie_goals = [
+        10 * w + 6.25 * h - 5 * age + 200 for w, h, age in zip(weights, heights, ages, strict=True)
+    ]
+    return [
+        UserDailyGoals(water_goal=water, calories_goal=calories)
+        for water, calories in zip(water_goals, calorie_goals, strict=True)
+    ]
 
 
 class WeatherService:
-    @staticmethod
-    async def get_weather(city: str) -> float | None:
-        return await get_current_weather(city)
+    def __init__(self, http_client: HttpClient, api_url: str = WEATHER_API_URL):
+        self.http_client = http_client
+        self.api_url = api_url
+
+    async def get_weather(
+        self, city: str, priority: Priority = Priority.INTERACTIVE
+    ) -> float | None:
+        try:
+            return await get_current_weather(
+                city, self.http_client, self.api_url, priority=priority
+            )
+        except (RateLimitExceeded, UpstreamUnavailable):
+            return None
+
+    async def refresh_weather(
+        self, city: str, priority: Priority = Priority.BACKGROUND
+    ) -> float | None:
+        """Запросить погоду мимо кэша и положить свежее значение в кэш."""
+        try:
+            temperature = await get_current_weather.__wrapped__(
+                city, self.http_client, self.api_url, priority=priority
+            )
+        except (RateLimitExceeded, UpstreamUnavailable):
+            return None
+        if temperature is not None:
+            get_current_weather.cache.set(city, temperature)
+        return temperature
+
+    def utc_offset(self, city: str) -> int | None:
+        """Смещение от UTC из ответа погоды или из базы, `None` - пока неизвестно."""
+        return utc_offsets.get(city)
 
 
 class FoodService:
-    @staticmethod
-    async def get_food_info(product_name: str) -> FoodInfo | None:
-        return await get_food_info(product_name)
+    def __init__(
+        self,
+        http_client: HttpClient,
+        api_url: str = FOOD_API_URL,
+        food_index: FoodIndex | None = None,
+    ):
+        self.http_client = http_client
+        self.api_url = api_url
+        self.food_index = food_index
+
+    async def get_food_info(
+        self, product_name: str, priority: Priority = Priority.INTERACTIVE
+    ) -> FoodInfo | None:
+        """Сначала локальный индекс, при промахе - OpenFoodFacts.
+
+        `RateLimitExceeded` и `UpstreamUnavailable` пробрасываются: пользователю
+        нужен другой ответ.
+        """
+        if self.food_index is not None:
+            food_info = await run_blocking(self.food_index.lookup, product_name)
+            if food_info is not None:
+                return food_info
+        return await get_food_info(product_name, self.http_client, self.api_url, priority=priority)
+
+    async def search_food(
+        self, product_name: str, priority: Priority = Priority.INTERACTIVE
+    ) -> list[FoodInfo]:
+        """Несколько подходящих продуктов, лучший первым."""
+        if self.food_index is not None:
+            food_info = await run_blocking(self.food_index.lookup, product_name)
+            if food_info is not None:
+                return [food_info]
+        return await search_food(product_name, self.http_client, self.api_url, priority=priority)
 
 
 class UserManager:
+    __slots__ = (
+        "_current_weather",
+        "_goals",
+        "_progress",
+        "_rendered",
+        "_version",
+        "event_sink",
+        "food_service",
+        "profile",
+        "weather_service",
+    )
+
     def __init__(
         self,
         profile: UserProfile,
@@ -54,61 +172,165 @@ class UserManager:
         food_service: FoodService,
     ):
         self.profile = profile
-        self.progress = UserProgress()
         self.weather_service = weather_service
         self.food_service = food_service
-        self.goals = None
-        self.current_weather = None
+        self._progress = UserProgress()
+        self._goals: UserDailyGoals | None = None
+        self._current_weather: float | None = None
+        # версия растёт при каждом изменении прогресса, целей или погоды
+        self._version = 0
+        self._rendered: tuple[int, str] | None = None
+        # куда отправлять записи журнала, назначается хранилищем
+        self.event_sink: Callable[[LoggedEvent], None] | None = None
+
+    @property
+    def progress(self) -> UserProgress:
+        return self._progress
+
+    @progress.setter
+    def progress(self, progress: UserProgress) -> None:
+        self._progress = progress
+        self._version += 1
+
+    @property
+    def goals(self) -> UserDailyGoals | None:
+        return self._goals
+
+    @goals.setter
+    def goals(self, goals: UserDailyGoals | None) -> None:
+        self._goals = goals
+        self._version += 1
+
+    @property
+    def current_weather(self) -> float | None:
+        return self._current_weather
+
+    @current_weather.setter
+    def current_weather(self, temperature: float | None) -> None:
+        self._current_weather = temperature
+        self._version += 1
 
     @classmethod
     async def create(
         cls,
         profile: UserProfile,
-        weather_service: WeatherService = WeatherService(),
-        food_service: FoodService = FoodService(),
+        weather_service: WeatherService,
+        food_service: FoodService,
     ):
         instance = cls(profile, weather_service, food_service)
         instance.goals = await instance.calculate_goals()
+        instance.progress = UserProgress(day=instance.today() or "")
         return instance
 
+    def today(self) -> str | None:
+        """Местная дата в городе пользователя, `None`, пока смещение неизвестно.
+
+        День по UTC восточнее Гринвича может отставать от местного, и тогда первая
+        смена дня унесла бы утренний прогресс во вчерашний архив. Пустой день
+        смена дня просто заменяет местной датой.
+        """
+        utc_offset = self.weather_service.utc_offset(self.profile.city)
+        return None if utc_offset is None else local_day(utc_offset)
+
     async def calculate_goals(self) -> UserDailyGoals:
         """Вычисление формулы для целей"""
         self.current_weather = await self.weather_service.get_weather(self.profile.city)
-        water_bonus = 500 if self.current_weather and self.current_weather > 25 else 0  # noqa: PLR2004
+        return self.compute_goals()
 
-        water_goal = self.profile.weight * 30 + (self.profile.activity_min / 30 * 500) + water_bonus
-        calorie_goal = (
-            10 * self.profile.weight + 6.25 * self.profile.height - 5 * self.profile.age + 200
-        )
+    def compute_goals(self) -> UserDailyGoals:
+        """Формула целей по профилю и уже известной погоде."""
+        return compute_goals_batch([self.profile], [self.current_weather])[0]
 
-        return UserDailyGoals(water_goal=water_goal, calories_goal=calorie_goal)
+    def update_weather(self, temperature: float) -> None:
+        """Обновить погоду и пересчитать цели без обращения к API."""
+        self.current_weather = temperature
+        self.goals = self.compute_goals()
 
-    async def log_food(self, product_name: str, grams: int) -> str:
-        food_info = await self.food_service.get_food_info(product_name)
+    async def log_food(self, product_name: str, grams: float) -> str:
+        try:
+            food_info = await self.food_service.get_food_info(product_name)
+        except RateLimitExceeded:
+            return "Сервис с информацией о еде перегружен, попробуйте позже."
+        except UpstreamUnavailable:
+            return "Сервис с информацией о еде сейчас недоступен, попробуйте позже."
         if not food_info:
             return "Информация о еде не найдена."
 
         calories = food_info.calories * grams / 100
         self.progress.logged_calories += calories
-        return f"Залоггировано {calories:.2f} ккал {grams}г {product_name}."
+        self._version += 1
+        self._emit(LoggedEvent("food", product_name, grams, calories))
+        return f"Залоггировано {calories:.2f} ккал {grams:g}г {product_name}."
+
+    async def log_foods(self, items: list[tuple[str, float]]) -> str:
+        """Залоггировать приём пищи из нескольких продуктов одним обновлением прогресса.
+
+        Поиск всех продуктов идёт параллельно, одинаковые названия ищутся один раз.
+        """
+        names = list(dict.fromkeys(name for name, _ in items))
+        results = await asyncio.gather(
+            *(self.food_service.get_food_info(name) for name in names), return_exceptions=True
+        )
+        found = dict(zip(names, results, strict=True))
+
+        lines = []
+        total = 0.0
+        for name, grams in items:
+            food_info = found[name]
+            if isinstance(food_info, RateLimitExceeded):
+                lines.append(f"{name}: сервис перегружен, попробуйте позже.")
+                continue
+            if isinstance(food_info, UpstreamUnavailable):
+                lines.append(f"{name}: сервис недоступен, попробуйте позже.")
+                continue
+            if isinstance(food_info, BaseException):
+                raise food_info
+            if not food_info:
+                lines.append(f"{name}: информация не найдена.")
+                continue
+            calories = food_info.calories * grams / 100
+            total += calories
+            self._emit(LoggedEvent("food", name, grams, calories))
+            lines.append(f"{name} {grams:g}г - {calories:.2f} ккал")
+
+        self.progress.logged_calories += total
+        self._version += 1
+        lines.append(f"Залоггировано {total:.2f} ккал.")
+        return "\n".join(lines)
 
     def log_water(self, amount: int) -> str:
         self.progress.logged_water += amount
+        self._version += 1
+        self._emit(LoggedEvent("water", "вода", amount))
         return f"Залоггировано {amount} мл воды. Всего выпито: {self.progress.logged_water} мл."
 
     def log_activity(self, activity: str, minutes: int) -> str:
-        if activity not in ACTIVITIES_1M_CAL_BURN:
+        found = get_catalog().get(activity)
+        if found is None:
             return f"Неверная активность '{activity}'."
 
-        calories_activity = ACTIVITIES_1M_CAL_BURN[activity]
-        burned_calories = calories_activity * minutes
+        burned_calories = found.burned_calories(self.profile.weight, minutes)
         self.progress.burned_calories += burned_calories
+        self._version += 1
+        self._emit(LoggedEvent("activity", found.name, minutes, burned_calories))
         return (
             f"Сожжено {burned_calories:.2f} ккал после занятий {minutes} минут "
-            f"от активности {activity}."
+            f"от активности {found.name} (MET {found.met:g}, вес {self.profile.weight:g} кг)."
         )
 
+    def _emit(self, event: LoggedEvent) -> None:
+        # пока день не назначен, событие получает местную дату, если она уже известна
+        event.day = self.progress.day or self.today() or ""
+        if self.event_sink is not None:
+            self.event_sink(event)
+
     def get_progress(self) -> str:
+        """HTML-отчёт о прогрессе, пересобирается только после изменений."""
+        if self._rendered is None or self._rendered[0] != self._version:
+            self._rendered = (self._version, self._render_progress())
+        return self._rendered[1]
+
+    def _render_progress(self) -> str:
         water_remaining = max(self.goals.water_goal - self.progress.logged_water, 0)
         calories_remaining = max(
             self.goals.calories_goal
@@ -0,0 +1,81 @@
+"""Точка входа: `hw-food-bot polling` или `hw-food-bot webhook`."""
+
+import argparse
+import os
+
+from telegram import Update
+
+from hw_food_bot.sharding import build_router
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="hw-food-bot", description="Telegram-бот для трекинга")
+    parser.add_argument(
+        "mode",
+        nargs="?",
+        choices=["polling", "webhook"],
+        default=os.getenv("BOT_MODE", "polling"),
+    )
+    parser.add_argument(
+        "--concurrent-updates",
+        type=int,
+        default=None,
+        help="сколько апдейтов разных чатов обрабатывать одновременно",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("BOT_WORKERS", "1")),
+        help="процессов-воркеров, апдейты делятся между ними по user_id",
+    )
+    webhook = parser.add_argument_group("webhook")
+    webhook.add_argument("--host", default=os.getenv("WEBHOOK_HOST", "0.0.0.0"))
+    webhook.add_argument("--port", type=int, default=int(os.getenv("WEBHOOK_PORT", "8080")))
+    webhook.add_argument("--path", default=os.getenv("WEBHOOK_PATH", "/telegram"))
+    webhook.add_argument(
+        "--url",
+        default=os.getenv("WEBHOOK_URL"),
+        help="публичный адрес бота, без него вебхук в Telegram не регистрируется",
+    )
+    webhook.add_argument(
+        "--secret-token",
+        default=os.getenv("WEBHOOK_SECRET"),
+        help="секрет вебхука, общий для всех реплик; обязателен в режиме webhook",
+    )
+    args = parser.parse_args(argv)
+    if args.mode == "webhook" and not args.secret_token:
+        parser.error("webhook mode requires --secret-token or WEBHOOK_SECRET")
+    return args
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+
+    # воркеры (spawn) заново импортируют главный модуль, а bot читает METRICS_PORT
+    # при импорте - до того, как воркер сдвинет его на свой порт
+    from hw_food_bot.bot import BOT_TOKEN, CONCURRENT_UPDATES, build_application  # noqa: PLC0415
+
+    concurrent_updates = args.concurrent_updates or CONCURRENT_UPDATES
+    if args.workers > 1:
+        application = build_router(BOT_TOKEN, args.workers, concurrent_updates)
+    else:
+        application = build_application(concurrent_updates)
+    if args.mode == "polling":
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        return
+
+    # uvicorn нужен только вебхуку, polling стартует без него
+    from hw_food_bot.webhook import run_webhook  # noqa: PLC0415
+
+    run_webhook(
+        application,
+        args.url,
+        args.secret_token,
+        host=args.host,
+        port=args.port,
+        path=args.path,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""Загрузка настроек из `.env` - один раз и без обхода дерева каталогов.
+
+Модули читают свои переменные окружения при импорте, поэтому `.env`
+загружается при импорте пакета, раньше любого из них. Путь к файлу можно
+задать через `ENV_FILE`, по умолчанию это `.env` в текущем каталоге.
+Уже заданные переменные окружения не перезаписываются.
+"""
+
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+_loaded = False
+
+
+def load_env(path: str | Path | None = None) -> None:
+    global _loaded  # noqa: PLW0603
+    if _loaded:
+        return
+    _loaded = True
+    env_file = Path(path or os.environ.get("ENV_FILE", ".env"))
+    if env_file.is_file():
+        load_dotenv(env_file)
@@ -0,0 +1,119 @@
+"""Смена дня: архив вчерашних итогов, обнуление прогресса и новые цели.
+
+Пользователи группируются по городу, а значит и по часовому поясу: погода
+каждого города запрашивается один раз (обычно это попадание в кэш), а цели
+для всей группы считаются одним вызовом `compute_goals_batch`.
+
+Город, чьё смещение от UTC неизвестно (его нет в базе, а погода не ответила),
+пропускается до следующего прохода: день по UTC для него мог бы оказаться
+вчерашним, и тогда свежий прогресс ушёл бы в архив под чужой датой. По той же
+причине день только сдвигается вперёд.
+"""
+
+import asyncio
+import logging
+import os
+
+from telegram.ext import Application, CallbackContext
+
+from hw_food_bot.calories_math import (
+    UserManager,
+    UserProgress,
+    WeatherService,
+    compute_goals_batch,
+    local_day,
+)
+from hw_food_bot.rate_limit import Priority
+from hw_food_bot.storage import UserStore
+
+logger = logging.getLogger(__name__)
+
+# как часто проверять, не наступил ли где-то новый день
+DAY_ROLLOVER_INTERVAL = float(os.getenv("DAY_ROLLOVER_INTERVAL", "300"))
+
+
+def schedule_day_rollover(application: Application) -> None:
+    application.job_queue.run_repeating(
+        run_day_rollover,
+        interval=DAY_ROLLOVER_INTERVAL,
+        first=min(30.0, DAY_ROLLOVER_INTERVAL),
+        name="day_rollover",
+    )
+
+
+async def run_day_rollover(context: CallbackContext) -> None:
+    await roll_over_days(context.bot_data["user_store"], context.bot_data["weather_service"])
+
+
+async def roll_over_days(user_store: UserStore, weather_service: WeatherService) -> int:
+    """Закрыть день у всех, у кого он сменился, вернуть число таких пользователей."""
+    cities = user_store.cities()
+    # смещение города берётся из базы или из ответа погоды
+    unknown = [city for city in cities if weather_service.utc_offset(city) is None]
+    if unknown:
+        await asyncio.gather(
+            *(weather_service.get_weather(city, priority=Priority.BACKGROUND) for city in unknown)
+        )
+        # сохранить узнанные смещения сразу, не дожидаясь изменений пользователей
+        await user_store.flush()
+
+    due: dict[str, tuple[str, list[tuple[int, UserManager]]]] = {}
+    for city in cities:
+        utc_offset = weather_service.utc_offset(city)
+        if utc_offset is None:
+            logger.debug("utc offset of %s is unknown, day rollover postponed", city)
+            continue
+        today = local_day(utc_offset)
+        # ISO-даты сравниваются как строки; пустой день (профиль до этой версии) - раньше любого
+        stale = [
+            (user_id, user)
+            for user_id, user in user_store.users_in_city(city)
+            if user.progress.day < today
+        ]
+        if stale:
+            due[city] = (today, stale)
+    if not due:
+        return 0
+
+    temperatures = await asyncio.gather(
+        *(weather_service.get_weather(city, priority=Priority.BACKGROUND) for city in due)
+    )
+
+    archive = []
+    rolled = 0
+    for (city, (today, users)), temperature in zip(due.items(), temperatures, strict=True):
+        # без свежей погоды считаем по последней известной
+        city_temperatures = [
+            temperature if temperature is not None else user.current_weather for _, user in users
+        ]
+        goals = compute_goals_batch([user.profile for _, user in users], city_temperatures)
+        for (user_id, user), user_goals, user_temperature in zip(
+            users, goals, city_temperatures, strict=True
+        ):
+            progress = user.progress
+            # день ещё не назначен (профиль до этой версии или создан, пока часовой
+            # пояс был неизвестен) - прогресс остаётся сегодняшним, архивировать нечего
+            if progress.day:
+                archive.append(
+                    (
+                        user_id,
+                        progress.day,
+                        progress.logged_water,
+                        progress.logged_calories,
+                        progress.burned_calories,
+                    )
+                )
+                user.progress = UserProgress(day=today)
+            else:
+                progress.day = today
+            user.current_weather = user_temperature
+            user.goals = user_goals
+            user_store.mark_dirty(user_id)
+            rolled += 1
+        logger.debug("day %s started for %s users in %s", today, len(users), city)
+
+    await user_store.archive_days(archive)
+    logger.info(
+        "rolled over %s users in %s cities, %s days archived", rolled, len(due), len(archive)
+    )
+    return rolled
@@ -0,0 +1,236 @@
+"""Выгрузка истории: сырые события и итоги по дням, неделям и месяцам в CSV или Parquet.
+
+Строки читаются курсором пачками по `EXPORT_CHUNK_ROWS` и сразу пишутся в файл,
+так что память не зависит от размера выгрузки. Из бота всё это работает в
+отдельном потоке со своим read-only соединением, из ноутбука или консоли -
+напрямую:
+
+    python -m hw_food_bot.export users.db weeks weeks.parquet
+
+    from hw_food_bot.export import connect, read_table
+    columns, rows = read_table(connect("users.db"), "weeks")
+
+Parquet требует pyarrow (`pip install pyarrow`), без него доступен только CSV.
+"""
+
+import argparse
+import asyncio
+import csv
+import os
+import sqlite3
+import tempfile
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from enum import StrEnum
+from pathlib import Path
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "10000"))
+# больше одновременных выгрузок не нужно: каждая читает базу целиком
+EXPORT_CONCURRENCY = 2
+
+
+class ExportKind(StrEnum):
+    EVENTS = "events"
+    DAYS = "days"
+    WEEKS = "weeks"
+    MONTHS = "months"
+
+
+class ExportFormat(StrEnum):
+    CSV = "csv"
+    PARQUET = "parquet"
+
+
+class ExportUnavailable(Exception):
+    """Формат не поддерживается в этом окружении (нет pyarrow)."""
+
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+    type: type
+
+
+@dataclass(frozen=True)
+class Query:
+    columns: tuple[Column, ...]
+    sql: str
+    order: str
+
+
+EVENT_COLUMNS = (
+    Column("user_id", int),
+    Column("ts", str),
+    Column("day", str),
+    Column("kind", str),
+    Column("name", str),
+    Column("amount", float),
+    Column("calories", float),
+)
+
+
+def _period_query(period: str, expression: str) -> Query:
+    # итоги периода складываются из дневных, сырые события не перечитываются
+    return Query(
+        (
+            Column("user_id", int),
+            Column(period, str),
+            Column("water", float),
+            Column("calories_in", float),
+            Column("calories_burned", float),
+            Column("events", int),
+            Column("days", int),
+        ),
+        f"SELECT user_id, {expression} AS period, SUM(water), SUM(calories_in), "
+        "SUM(calories_burned), SUM(events), COUNT(*) FROM daily_rollups {where} "
+        "GROUP BY user_id, period",
+        "user_id, period",
+    )
+
+
+QUERIES = {
+    ExportKind.EVENTS: Query(
+        EVENT_COLUMNS,
+        "SELECT user_id, strftime('%Y-%m-%dT%H:%M:%SZ', ts, 'unixepoch'), day, kind, name, "
+        "amount, calories FROM events {where}",
+        "user_id, ts",
+    ),
+    ExportKind.DAYS: Query(
+        (
+            Column("user_id", int),
+            Column("day", str),
+            Column("water", float),
+            Column("calories_in", float),
+            Column("calories_burned", float),
+            Column("events", int),
+        ),
+        "SELECT user_id, day, water, calories_in, calories_burned, events "
+        "FROM daily_rollups {where}",
+        "user_id, day",
+    ),
+    ExportKind.WEEKS: _period_query("week", "strftime('%Y-W%W', day)"),
+    ExportKind.MONTHS: _period_query("month", "strftime('%Y-%m', day)"),
+}
+
+_slots = asyncio.Semaphore(EXPORT_CONCURRENCY)
+
+
+def connect(path: str | Path) -> sqlite3.Connection:
+    """Соединение только для чтения: выгрузка не мешает записи бота (WAL)."""
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+
+def iter_chunks(
+    conn: sqlite3.Connection,
+    kind: ExportKind,
+    user_id: int | None = None,
+    chunk_size: int = EXPORT_CHUNK_ROWS,
+) -> Iterator[list[tuple]]:
+    """Строки выгрузки пачками; без `user_id` - по всем пользователям."""
+    query = QUERIES[kind]
+    where, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    sql = query.sql.format(where=where)
+    cursor = conn.execute(f"{sql} ORDER BY {query.order}", params)
+    while chunk := cursor.fetchmany(chunk_size):
+        yield chunk
+
+
+def read_table(
+    conn: sqlite3.Connection, kind: ExportKind | str, user_id: int | None = None
+) -> tuple[list[str], list[tuple]]:
+    """Вся выгрузка в памяти: имена колонок и строки, например для `pd.DataFrame`."""
+    kind = ExportKind(kind)
+    rows = [row for chunk in iter_chunks(conn, kind, user_id) for row in chunk]
+    return [column.name for column in QUERIES[kind].columns], rows
+
+
+def write_csv(chunks: Iterator[list[tuple]], columns: tuple[Column, ...], path: Path) -> int:
+    rows = 0
+    with path.open("w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([column.name for column in columns])
+        for chunk in chunks:
+            writer.writerows(chunk)
+            rows += len(chunk)
+    return rows
+
+
+def write_parquet(chunks: Iterator[list[tuple]], columns: tuple[Column, ...], path: Path) -> int:
+    try:
+        import pyarrow as pa  # noqa: PLC0415
+        import pyarrow.parquet as pq  # noqa: PLC0415
+    except ImportError as e:
+        raise ExportUnavailable("parquet export needs pyarrow") from e
+
+    types = {int: pa.int64(), float: pa.float64(), str: pa.string()}
+    schema = pa.schema([(column.name, types[column.type]) for column in columns])
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            # каждая пачка - отдельная row group, колонки собираются только для неё
+            arrays = [
+                pa.array([row[i] for row in chunk], type=field.type)
+                for i, field in enumerate(schema)
+            ]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            rows += len(chunk)
+    return rows
+
+
+WRITERS = {ExportFormat.CSV: write_csv, ExportFormat.PARQUET: write_parquet}
+
+
+def export(
+    db_path: str | Path,
+    kind: ExportKind,
+    fmt: ExportFormat,
+    output: Path,
+    user_id: int | None = None,
+) -> int:
+    """Записать выгрузку в `output`, вернуть число строк."""
+    conn = connect(db_path)
+    try:
+        return WRITERS[fmt](iter_chunks(conn, kind, user_id), QUERIES[kind].columns, output)
+    finally:
+        conn.close()
+
+
+def export_to_temp(
+    db_path: str | Path, kind: ExportKind, fmt: ExportFormat, user_id: int | None = None
+) -> tuple[Path, int]:
+    """Выгрузка во временный файл: (путь, число строк). Удалить файл - забота вызывающего."""
+    fd, name = tempfile.mkstemp(prefix="hw-food-bot-", suffix=f".{fmt}")
+    os.close(fd)
+    output = Path(name)
+    try:
+        return output, export(db_path, kind, fmt, output, user_id)
+    except BaseException:
+        output.unlink(missing_ok=True)
+        raise
+
+
+async def export_file(
+    db_path: str | Path, kind: ExportKind, fmt: ExportFormat, user_id: int | None = None
+) -> tuple[Path, int]:
+    """`export_to_temp` в отдельном потоке, не больше `EXPORT_CONCURRENCY` сразу."""
+    async with _slots:
+        return await asyncio.to_thread(export_to_temp, db_path, kind, fmt, user_id)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Выгрузить историю пользователей")
+    parser.add_argument("db", type=Path, help="база бота (USER_DB)")
+    parser.add_argument("kind", choices=list(ExportKind))
+    parser.add_argument("output", type=Path, help="файл .csv или .parquet")
+    parser.add_argument("--user", type=int, help="только этот пользователь")
+    args = parser.parse_args()
+
+    fmt = ExportFormat.PARQUET if args.output.suffix == ".parquet" else ExportFormat.CSV
+    started = time.perf_counter()
+    rows = export(args.db, ExportKind(args.kind), fmt, args.output, args.user)
+    print(f"{rows} rows exported in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
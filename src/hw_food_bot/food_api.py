@@ -1,48 +1,166 @@
+import codecs
+import difflib
 import json
 import logging
-from functools import lru_cache
+import os
+import re
+from dataclasses import dataclass
 
-from aiolimiter import AsyncLimiter
-from niquests import AsyncSession
-from pydantic.dataclasses import dataclass
+from hw_food_bot.async_cache import async_cached
+from hw_food_bot.http_client import HttpClient
+from hw_food_bot.metrics import timed_upstream
+from hw_food_bot.offload import run_blocking
+from hw_food_bot.rate_limit import Priority, get_limiter
+from hw_food_bot.resilience import UpstreamError, get_breaker
 
 logger = logging.getLogger(__name__)
 
 
-rate_limit = AsyncLimiter(max_rate=10, time_period=59)
+rate_limit = get_limiter("food_api", max_rate=10, time_period=59)
+breaker = get_breaker("food_api")
+# ответ OpenFoodFacts целиком, без ожидания лимита
+FOOD_API_TIMEOUT = float(os.getenv("FOOD_API_TIMEOUT", "8"))
 
+FOOD_API_URL = "https://world.openfoodfacts.org/cgi/search.pl"
+SEARCH_PAGE_SIZE = 10
+SHORTLIST_SIZE = 5
+STREAM_CHUNK_SIZE = 16 * 1024
 
-@dataclass
+PRODUCTS_ARRAY = re.compile(r'"products"\s*:\s*\[')
+SEPARATORS = re.compile(r"[\s,]*")
+
+
+@dataclass(slots=True)
 class FoodInfo:
     product_name: str
     calories: float = 0
 
 
-@lru_cache(maxsize=1024)
-async def get_food_info(product_name: str) -> FoodInfo | None:
-    url = f"https://world.openfoodfacts.org/cgi/search.pl?action=process&search_terms={product_name}&json=true"
-    if rate_limit.has_capacity():
-        async with rate_limit:
-            logger.info("food api call of: " + product_name)
-            async with AsyncSession() as s:
-                response = await s.get(url)
-    else:
-        logger.info("food api is over limit")
-        return None
+class ProductStream:
+    """Инкрементальный разбор массива `products` из ответа поиска OpenFoodFacts.
+
+    Байты подаются кусками через `feed`, готовые продукты отдаются по одному,
+    так что можно перестать читать ответ, как только кандидатов достаточно.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self.done = False
 
-    if response.status_code == 200:  # noqa: PLR2004
-        data = response.json()
-        products = data.get("products", [])
-        if products:  # Проверяем, есть ли найденные продукты
-            chosen_product = products[0]
-            for product in products:
-                if product.get("nutriments", {}).get("energy-kcal_100g", 0) != 0:
-                    chosen_product = product
-                    break
-            return FoodInfo(
-                product_name=chosen_product.get("product_name", "Неизвестно"),
-                calories=chosen_product.get("nutriments", {}).get("energy-kcal_100g", 0),
-            )
+    def feed(self, chunk: bytes) -> list[dict]:
+        self._buffer += self._decoder.decode(chunk)
+        products = []
+        if not self._in_array:
+            start = PRODUCTS_ARRAY.search(self._buffer)
+            if start is None:
+                return products
+            self._in_array = True
+            self._pos = start.end()
+        while not self.done:
+            self._pos = SEPARATORS.match(self._buffer, self._pos).end()
+            if self._pos >= len(self._buffer):
+                break
+            if self._buffer[self._pos] == "]":
+                self.done = True
+                break
+            try:
+                product, self._pos = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                break  # объект ещё не дочитан
+            products.append(product)
+        # разобранное больше не нужно
+        self._buffer = self._buffer[self._pos :]
+        self._pos = 0
+        return products
+
+
+def to_food_info(product: dict) -> FoodInfo | None:
+    calories = product.get("nutriments", {}).get("energy-kcal_100g")
+    if not isinstance(calories, int | float) or calories <= 0:
         return None
-    logger.error(f"Ошибка: {response.status_code}, {json.dumps(response.json())}")
-    return None
+    return FoodInfo(product_name=product.get("product_name") or "Неизвестно", calories=calories)
+
+
+def rank_candidates(product_name: str, candidates: list[FoodInfo]) -> list[FoodInfo]:
+    """Ближайшие по названию впереди, при равенстве - порядок выдачи API."""
+    query = product_name.lower()
+    return sorted(
+        candidates,
+        key=lambda c: -difflib.SequenceMatcher(None, query, c.product_name.lower()).ratio(),
+    )
+
+
+# калорийность меняется редко: сутки свежая, ещё неделю годится, пока API недоступен
+@async_cached(
+    maxsize=1024,
+    ttl=24 * 60 * 60,
+    negative_ttl=10 * 60,
+    key=lambda product_name, *_, **__: product_name,
+    negative=lambda candidates: not candidates,
+    stale_ttl=7 * 24 * 60 * 60,
+    refresh_ahead=0.1,
+)
+@timed_upstream("food")
+async def search_food(
+    product_name: str,
+    client: HttpClient,
+    api_url: str = FOOD_API_URL,
+    priority: Priority = Priority.INTERACTIVE,
+) -> list[FoodInfo]:
+    """Шорт-лист продуктов с известной калорийностью, лучший первым.
+
+    `RateLimitExceeded`, если не дождались лимита, `UpstreamUnavailable`, если
+    API не ответил за `FOOD_API_TIMEOUT` или цепь разомкнута.
+    """
+    breaker.raise_if_open()
+    await rate_limit.acquire(priority)
+    logger.info("food api call of: %s", product_name)
+    return await breaker.call(
+        lambda: fetch_candidates(product_name, client, api_url), FOOD_API_TIMEOUT
+    )
+
+
+async def fetch_candidates(product_name: str, client: HttpClient, api_url: str) -> list[FoodInfo]:
+    params = {
+        "action": "process",
+        "search_terms": product_name,
+        "json": "true",
+        "fields": "product_name,nutriments",
+        "page_size": SEARCH_PAGE_SIZE,
+    }
+    response = await client.get(api_url, params=params, stream=True)
+
+    try:
+        if response.status_code >= 500 or response.status_code == 429:  # noqa: PLR2004
+            raise UpstreamError(f"food api returned {response.status_code}")
+        if response.status_code != 200:  # noqa: PLR2004
+            logger.error("Ошибка: %s, %r", response.status_code, (await response.content)[:500])
+            return []
+
+        stream = ProductStream()
+        candidates = []
+        async for chunk in await response.iter_content(STREAM_CHUNK_SIZE):
+            for product in await run_blocking(stream.feed, chunk):
+                food_info = to_food_info(product)
+                if food_info is not None:
+                    candidates.append(food_info)
+            if stream.done or len(candidates) >= SHORTLIST_SIZE:
+                break
+    finally:
+        await response.close()
+    return rank_candidates(product_name, candidates)
+
+
+async def get_food_info(
+    product_name: str,
+    client: HttpClient,
+    api_url: str = FOOD_API_URL,
+    priority: Priority = Priority.INTERACTIVE,
+) -> FoodInfo | None:
+    """Найти калорийность продукта. Исключения те же, что у `search_food`."""
+    candidates = await search_food(product_name, client, api_url, priority=priority)
+    return candidates[0] if candidates else None
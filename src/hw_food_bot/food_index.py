@@ -0,0 +1,180 @@
+"""Локальный индекс калорийности продуктов из дампа OpenFoodFacts.
+
+Сборка (CSV с табуляцией или JSONL, можно .gz):
+
+    python -m hw_food_bot.food_index en.openfoodfacts.org.products.csv.gz food_index.db
+
+Индекс - это SQLite-файл с таблицей названий и FTS5-индексом по триграммам от
+транслитерированного названия, так что "банан" находит и "banana".
+"""
+
+import argparse
+import csv
+import difflib
+import gzip
+import json
+import logging
+import re
+import sqlite3
+import sys
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+from hw_food_bot.food_api import FoodInfo
+
+logger = logging.getLogger(__name__)
+
+TRANSLIT = str.maketrans(
+    {
+        "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh",
+        "з": "z", "и": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+        "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "ts",
+        "ч": "ch", "ш": "sh", "щ": "sch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu",
+        "я": "ya",
+    }
+)  # fmt: skip
+NON_WORD = re.compile(r"[^a-z0-9]+")
+MIN_SIMILARITY = 0.6
+BATCH_SIZE = 10_000
+INSERT_FOOD = "INSERT OR IGNORE INTO foods (key, name, calories) VALUES (?, ?, ?)"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS foods (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    calories REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5(
+    key, content='foods', content_rowid='id', tokenize='trigram'
+);
+"""
+
+
+def normalize(name: str) -> str:
+    """Ключ поиска: нижний регистр, латиница, слова через пробел."""
+    return NON_WORD.sub(" ", name.lower().translate(TRANSLIT)).strip()
+
+
+class FoodIndex:
+    """Поиск калорийности по локальному индексу.
+
+    Запрос - это пара обращений к SQLite в пределах миллисекунды, поэтому он
+    выполняется прямо в event loop, без переключения в поток.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = str(path)
+        self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def lookup(self, product_name: str) -> FoodInfo | None:
+        key = normalize(product_name)
+        if not key:
+            return None
+
+        row = self._conn.execute(
+            "SELECT name, calories FROM foods WHERE key = ?", (key,)
+        ).fetchone()
+        if row:
+            return FoodInfo(product_name=row[0], calories=row[1])
+
+        candidates = self._search(key)
+        if not candidates:
+            return None
+        # самое похожее из найденных по триграммам, с короткими названиями впереди
+        best = max(
+            candidates,
+            key=lambda c: (difflib.SequenceMatcher(None, key, c[0]).ratio(), -len(c[0])),
+        )
+        if difflib.SequenceMatcher(None, key, best[0]).ratio() < MIN_SIMILARITY:
+            return None
+        return FoodInfo(product_name=best[1], calories=best[2])
+
+    def _search(self, key: str, limit: int = 20) -> list[tuple[str, str, float]]:
+        if len(key) < 3:  # noqa: PLR2004
+            return []
+        query = '"' + key.replace('"', "") + '"'
+        rows = self._fts(query, limit)
+        if not rows:
+            # опечатки: достаточно совпадения части триграмм
+            trigrams = {key[i : i + 3] for i in range(len(key) - 2)}
+            rows = self._fts(" OR ".join(f'"{t}"' for t in trigrams), limit)
+        return rows
+
+    def _fts(self, query: str, limit: int) -> list[tuple[str, str, float]]:
+        return self._conn.execute(
+            "SELECT foods.key, foods.name, foods.calories FROM foods_fts "
+            "JOIN foods ON foods.id = foods_fts.rowid "
+            "WHERE foods_fts MATCH ? ORDER BY rank LIMIT ?",
+            (query, limit),
+        ).fetchall()
+
+
+def _open_text(path: Path):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return path.open(encoding="utf-8", newline="")
+
+
+def read_dump(path: Path) -> Iterator[tuple[str, float]]:
+    """Пары (название, ккал на 100 г) из CSV или JSONL дампа OpenFoodFacts."""
+    with _open_text(path) as f:
+        if ".jsonl" in path.suffixes or ".json" in path.suffixes:
+            for line in f:
+                product = json.loads(line)
+                yield (
+                    product.get("product_name"),
+                    product.get("nutriments", {}).get("energy-kcal_100g"),
+                )
+        else:
+            csv.field_size_limit(sys.maxsize)
+            for row in csv.DictReader(f, delimiter="\t"):
+                yield row.get("product_name"), row.get("energy-kcal_100g")
+
+
+def build_index(dump: Path, output: Path) -> int:
+    """Собрать индекс, вернуть количество уникальных продуктов."""
+    output.unlink(missing_ok=True)
+    conn = sqlite3.connect(output)
+    conn.executescript(SCHEMA)
+    batch = []
+    for name, raw_calories in read_dump(dump):
+        try:
+            calories = float(raw_calories)
+        except (TypeError, ValueError):
+            continue
+        if not name or calories <= 0:
+            continue
+        key = normalize(name)
+        if key:
+            batch.append((key, name.strip(), calories))
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(INSERT_FOOD, batch)
+            batch.clear()
+    conn.executemany(INSERT_FOOD, batch)
+    conn.execute("INSERT INTO foods_fts (foods_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO foods_fts (foods_fts) VALUES ('optimize')")
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM foods").fetchone()[0]
+    conn.execute("VACUUM")
+    conn.close()
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Собрать локальный индекс калорийности")
+    parser.add_argument("dump", type=Path, help="дамп OpenFoodFacts: .csv, .jsonl или .gz")
+    parser.add_argument("output", type=Path, help="куда записать индекс")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    count = build_index(args.dump, args.output)
+    print(f"{count} products indexed in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
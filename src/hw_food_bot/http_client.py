@@ -0,0 +1,92 @@
+"""Общий HTTP-клиент с пулом соединений для внешних API."""
+
+import asyncio
+import importlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from niquests import AsyncSession, Response
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HttpClientConfig:
+    connect_timeout: float = 3.0
+    read_timeout: float = 10.0
+    # число хостов в пуле и соединений на один хост
+    pool_connections: int = 10
+    pool_maxsize: int = 10
+    keepalive_delay: float = 600.0
+    http2: bool = True
+
+    @classmethod
+    def from_env(cls) -> "HttpClientConfig":
+        return cls(
+            connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", cls.connect_timeout)),
+            read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", cls.read_timeout)),
+            pool_connections=int(os.getenv("HTTP_POOL_CONNECTIONS", cls.pool_connections)),
+            pool_maxsize=int(os.getenv("HTTP_POOL_MAXSIZE", cls.pool_maxsize)),
+            keepalive_delay=float(os.getenv("HTTP_KEEPALIVE_DELAY", cls.keepalive_delay)),
+            http2=os.getenv("HTTP_DISABLE_HTTP2", "0") != "1",
+        )
+
+
+class HttpClient:
+    """Долгоживущая сессия: keep-alive и HTTP/2 вместо рукопожатия на каждый запрос.
+
+    Создаётся один раз в `post_init` приложения и закрывается в `post_shutdown`.
+    niquests импортируется только при старте сессии: это самый тяжёлый импорт бота.
+    """
+
+    def __init__(self, config: HttpClientConfig | None = None):
+        self.config = config or HttpClientConfig()
+        self._session: AsyncSession | None = None
+        self._lock = asyncio.Lock()
+        self._warm_up: asyncio.Task | None = None
+
+    def warm_up(self) -> None:
+        """Поднять сессию в фоне, не дожидаясь первого запроса."""
+        self._warm_up = asyncio.create_task(self.start())
+
+    async def start(self) -> None:
+        async with self._lock:
+            if self._session is not None:
+                return
+            # импорт в потоке, чтобы не останавливать event loop
+            niquests = await asyncio.to_thread(importlib.import_module, "niquests")
+            self._session = niquests.AsyncSession(
+                pool_connections=self.config.pool_connections,
+                pool_maxsize=self.config.pool_maxsize,
+                keepalive_delay=self.config.keepalive_delay,
+                disable_http2=not self.config.http2,
+                timeout=(self.config.connect_timeout, self.config.read_timeout),
+            )
+        logger.info(
+            "http client started (pool %s x %s, http2=%s)",
+            self.config.pool_connections,
+            self.config.pool_maxsize,
+            self.config.http2,
+        )
+
+    async def close(self) -> None:
+        if self._warm_up is not None:
+            # неудачный прогрев не должен мешать закрыть то, что успело подняться
+            try:
+                await self._warm_up
+            except Exception:
+                logger.exception("http client warm-up failed")
+            self._warm_up = None
+        if self._session is None:
+            return
+        await self._session.close()
+        self._session = None
+        logger.info("http client closed")
+
+    async def get(self, url: str, **kwargs: Any) -> "Response":
+        if self._session is None:
+            await self.start()
+        return await self._session.get(url, **kwargs)
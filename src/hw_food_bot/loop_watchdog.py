@@ -0,0 +1,84 @@
+"""Сторож event loop'а: задержка цикла и стек того, кто его заблокировал.
+
+Корутина-пульс раз в `interval` секунд отмечается и меряет, на сколько проснулась
+позже положенного. Отдельный поток следит за пульсом: если его нет дольше
+`threshold`, значит, какой-то колбэк держит цикл, и в лог пишется стек главного
+потока вместе с именем хендлера, в котором это происходит.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from hw_food_bot.metrics import EVENT_LOOP_LAG, EVENT_LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+
+def _handler_name(frame) -> str | None:
+    """Имя хендлера из обёртки `metrics.instrument_callback`, если она есть в стеке."""
+    while frame is not None:
+        if frame.f_code.co_name == "wrapper" and frame.f_globals.get("__name__") == (
+            "hw_food_bot.metrics"
+        ):
+            return frame.f_locals.get("name")
+        frame = frame.f_back
+    return None
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._heartbeat: asyncio.Task | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._heartbeat = asyncio.create_task(self._beat())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info("event loop watchdog started, threshold %.0f ms", self.threshold * 1000)
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+
+    async def _beat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            EVENT_LOOP_LAG.observe(max(now - expected, 0))
+            self._last_beat = now
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stop.wait(self.threshold / 2):
+            last_beat = self._last_beat
+            stalled = time.monotonic() - last_beat - self.interval
+            # об одной блокировке сообщаем один раз
+            if stalled < self.threshold or last_beat == reported_beat:
+                continue
+            reported_beat = last_beat
+            EVENT_LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            logger.warning(
+                "event loop blocked for %.0f ms in handler %s:\n%s",
+                stalled * 1000,
+                _handler_name(frame) or "<none>",
+                "".join(traceback.format_stack(frame)),
+            )
@@ -0,0 +1,190 @@
+"""Метрики в формате Prometheus: задержки хендлеров, внешних API, кэши, лимитеры и исходящие."""
+
+import functools
+import logging
+import time
+from collections.abc import Callable, Iterator
+
+from prometheus_client import Counter, Histogram, start_http_server
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from telegram.ext import Application, BaseHandler, ConversationHandler
+
+from hw_food_bot.async_cache import caches
+from hw_food_bot.outbox import dispatchers
+from hw_food_bot.rate_limit import limiters
+from hw_food_bot.reminders import schedulers
+from hw_food_bot.resilience import BreakerState, breakers
+
+logger = logging.getLogger(__name__)
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds",
+    "Время работы хендлера",
+    ["handler"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в хендлерах", ["handler"])
+UPSTREAM_LATENCY = Histogram(
+    "bot_upstream_seconds",
+    "Время запроса к внешнему API",
+    ["api", "outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+EVENT_LOOP_LAG = Histogram(
+    "bot_event_loop_lag_seconds",
+    "Опоздание пульса event loop'а",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+EVENT_LOOP_STALLS = Counter("bot_event_loop_stalls_total", "Блокировки event loop'а")
+
+
+def instrument_callback(name: str, callback: Callable) -> Callable:
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+def _walk(handler: BaseHandler) -> Iterator[BaseHandler]:
+    if isinstance(handler, ConversationHandler):
+        for nested in handler.entry_points + handler.fallbacks:
+            yield from _walk(nested)
+        for state_handlers in handler.states.values():
+            for nested in state_handlers:
+                yield from _walk(nested)
+    else:
+        yield handler
+
+
+def instrument_handlers(application: Application) -> None:
+    """Обернуть колбэки всех зарегистрированных хендлеров, включая вложенные в диалоги."""
+    for group in application.handlers.values():
+        for handler in group:
+            for leaf in _walk(handler):
+                name = getattr(leaf.callback, "__name__", type(leaf).__name__)
+                leaf.callback = instrument_callback(name, leaf.callback)
+
+
+def timed_upstream(api: str):
+    """Декоратор для вызовов внешних API: задержка с исходом ok/empty/error."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await func(*args, **kwargs)
+                outcome = "ok" if result else "empty"
+                return result
+            finally:
+                UPSTREAM_LATENCY.labels(api, outcome).observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+class StatsCollector(Collector):
+    """Счётчики кэшей, лимитеров, breaker'ов, очереди исходящих и напоминаний."""
+
+    def collect(self):
+        cache_ops = CounterMetricFamily("bot_cache_ops", "Обращения к кэшу", labels=["cache", "op"])
+        cache_size = GaugeMetricFamily("bot_cache_entries", "Записей в кэше", labels=["cache"])
+        for cache in caches:
+            for op in ("hits", "misses", "evictions", "coalesced", "stale", "refreshes"):
+                cache_ops.add_metric([cache.name, op], getattr(cache.stats, op))
+            cache_size.add_metric([cache.name], len(cache))
+
+        queue_depth = GaugeMetricFamily(
+            "bot_rate_limit_queue_depth", "Ожидающих в очереди лимитера", labels=["limiter"]
+        )
+        outcomes = CounterMetricFamily(
+            "bot_rate_limit_requests", "Исходы запросов токена", labels=["limiter", "outcome"]
+        )
+        wait = CounterMetricFamily(
+            "bot_rate_limit_wait_seconds", "Суммарное ожидание токена", labels=["limiter"]
+        )
+        for limiter in limiters.values():
+            stats = limiter.stats
+            queue_depth.add_metric([limiter.name], stats.queue_depth)
+            outcomes.add_metric([limiter.name, "acquired"], stats.acquired)
+            outcomes.add_metric([limiter.name, "timeout"], stats.timeouts)
+            outcomes.add_metric([limiter.name, "rejected"], stats.rejected)
+            wait.add_metric([limiter.name], stats.total_wait)
+
+        breaker_state = GaugeMetricFamily(
+            "bot_circuit_state", "Состояние цепи внешнего API", labels=["api", "state"]
+        )
+        breaker_events = CounterMetricFamily(
+            "bot_circuit_events", "Ошибки и отказы breaker'а", labels=["api", "event"]
+        )
+        for breaker in breakers.values():
+            for state in BreakerState:
+                breaker_state.add_metric([breaker.name, state], int(breaker.state is state))
+            for event in ("failures", "timeouts", "rejected", "opened"):
+                breaker_events.add_metric([breaker.name, event], getattr(breaker.stats, event))
+
+        outbox_depth = GaugeMetricFamily(
+            "bot_outbox_queue_depth", "Сообщений в очередях на отправку"
+        )
+        outbox_chats = GaugeMetricFamily("bot_outbox_chats", "Чатов с неотправленными сообщениями")
+        outbox_messages = CounterMetricFamily(
+            "bot_outbox_messages", "Исходы исходящих сообщений", labels=["outcome"]
+        )
+        outbox_delay = CounterMetricFamily(
+            "bot_outbox_delay_seconds", "Суммарное время сообщений в очереди"
+        )
+        outbox_stats = [dispatcher.stats for dispatcher in dispatchers]
+        outbox_depth.add_metric([], sum(stats.queued for stats in outbox_stats))
+        outbox_chats.add_metric([], sum(dispatcher.active_chats for dispatcher in dispatchers))
+        for outcome in ("sent", "merged", "retries", "flood_waits", "failed"):
+            outbox_messages.add_metric(
+                [outcome], sum(getattr(stats, outcome) for stats in outbox_stats)
+            )
+        outbox_delay.add_metric([], sum(stats.total_delay for stats in outbox_stats))
+
+        reminders_scheduled = GaugeMetricFamily(
+            "bot_reminders_scheduled", "Пользователей в расписании напоминаний"
+        )
+        reminders = CounterMetricFamily(
+            "bot_reminders", "Проверки и напоминания о воде", labels=["outcome"]
+        )
+        reminders_scheduled.add_metric([], sum(len(scheduler) for scheduler in schedulers))
+        for outcome in ("checked", "sent", "muted"):
+            reminders.add_metric(
+                [outcome], sum(getattr(scheduler.stats, outcome) for scheduler in schedulers)
+            )
+
+        yield from (
+            cache_ops,
+            cache_size,
+            queue_depth,
+            outcomes,
+            wait,
+            breaker_state,
+            breaker_events,
+            outbox_depth,
+            outbox_chats,
+            outbox_messages,
+            outbox_delay,
+            reminders_scheduled,
+            reminders,
+        )
+
+
+REGISTRY.register(StatsCollector())
+
+
+def start_metrics_server(port: int, addr: str = "127.0.0.1") -> None:
+    start_http_server(port, addr=addr)
+    logger.info("metrics are served on http://%s:%s/metrics", addr, port)
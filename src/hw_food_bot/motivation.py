@@ -1,9 +1,21 @@
 import random
 from pathlib import Path
 
-with Path("motivation.txt").open("r") as f:
-    motivation_lines = [line.strip() for line in f.readlines() if line]
+from hw_food_bot.offload import run_blocking
 
+MOTIVATION_FILE = Path(__file__).with_name("motivation.txt")
 
-def get_random_quote() -> str:
+motivation_lines: list[str] = []
+
+
+def _read_lines() -> list[str]:
+    with MOTIVATION_FILE.open("r") as f:
+        return [line.strip() for line in f.readlines() if line]
+
+
+async def get_random_quote() -> str:
+    # файл читается при первой цитате, а не при импорте
+    if not motivation_lines:
+        # присваивание, а не extend: параллельные первые вызовы не задвоят строки
+        motivation_lines[:] = await run_blocking(_read_lines)
     return random.choice(motivation_lines)
@@ -0,0 +1,18 @@
+"""Вынос блокирующих шагов (файлы, разбор больших ответов, SQLite) в пул потоков.
+
+Включается `OFFLOAD_BLOCKING=1`. Без него функции вызываются прямо в event loop:
+для мелких вызовов переключение в поток дороже самой работы.
+"""
+
+import asyncio
+import os
+from collections.abc import Callable
+from typing import Any
+
+enabled = os.getenv("OFFLOAD_BLOCKING", "0") == "1"
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any) -> Any:
+    if enabled:
+        return await asyncio.to_thread(func, *args)
+    return func(*args)
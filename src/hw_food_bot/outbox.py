@@ -0,0 +1,306 @@
+"""Исходящие сообщения: темп под лимиты Telegram, повторы после RetryAfter и склейка.
+
+Хендлеры не ждут доставки: `MessageDispatcher.send` кладёт сообщение в очередь
+чата и сразу возвращается. Отправитель чата соблюдает порядок, ждёт токен
+своего чата и общий токен бота, а всё, что за это время (и за `merge_window`)
+накопилось в очереди чата, уходит одним сообщением.
+
+Общий бакет живёт в бэкенде rate limiter'а, так что воркеры с `RATE_LIMIT_DB`
+делят один лимит на токен бота.
+"""
+
+import asyncio
+import datetime as dtm
+import logging
+import os
+import random
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from telegram import Bot
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from hw_food_bot.rate_limit import LimiterBackend, get_backend
+
+logger = logging.getLogger(__name__)
+
+# лимиты Telegram: около 30 сообщений в секунду на бота и 1 в секунду в один чат
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "30"))
+OUTBOX_CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", "1"))
+OUTBOX_CHAT_BURST = float(os.getenv("OUTBOX_CHAT_BURST", "3"))
+# сколько ждать следующего ответа в тот же чат, чтобы отправить их вместе
+OUTBOX_MERGE_WINDOW = float(os.getenv("OUTBOX_MERGE_WINDOW", "0.02"))
+# больше сообщений в очередях - `send` ждёт, пока очередь разгрузится
+OUTBOX_MAX_PENDING = int(os.getenv("OUTBOX_MAX_PENDING", "10000"))
+
+MERGE_SEPARATOR = "\n\n"
+MAX_NETWORK_ATTEMPTS = 5
+STOP_TIMEOUT = 30.0
+# как часто выбрасывать бакеты чатов, которые давно ничего не получали
+PRUNE_EVERY = 1000
+
+# все диспетчеры процесса, для метрик
+dispatchers: list["MessageDispatcher"] = []
+
+
+@dataclass(slots=True)
+class OutgoingMessage:
+    text: str
+    kwargs: dict[str, Any]
+    queued_at: float
+    # файл для `send_document`, текст тогда - подпись к нему
+    document: Path | None = None
+
+
+@dataclass
+class OutboxStats:
+    queued: int = 0
+    sent: int = 0
+    merged: int = 0
+    retries: int = 0
+    flood_waits: int = 0
+    failed: int = 0
+    total_delay: float = 0.0
+    max_delay: float = 0.0
+
+
+class _Chat:
+    __slots__ = ("messages", "tokens", "updated_at", "task")
+
+    def __init__(self, tokens: float):
+        self.messages: deque[OutgoingMessage] = deque()
+        self.tokens = tokens
+        self.updated_at = time.monotonic()
+        self.task: asyncio.Task | None = None
+
+
+def take_batch(messages: deque[OutgoingMessage]) -> list[OutgoingMessage]:
+    """Снять с головы очереди сообщения, которые можно отправить одним.
+
+    Склеиваются только сообщения с одинаковыми параметрами; клавиатура может
+    быть лишь у последнего, иначе она относилась бы не к тому тексту.
+    """
+    batch = [messages.popleft()]
+    length = len(batch[0].text)
+    while messages:
+        last, following = batch[-1], messages[0]
+        if "reply_markup" in last.kwargs or last.document or following.document:
+            break
+        kwargs = {key: value for key, value in following.kwargs.items() if key != "reply_markup"}
+        length += len(MERGE_SEPARATOR) + len(following.text)
+        if kwargs != last.kwargs or length > MessageLimit.MAX_TEXT_LENGTH:
+            break
+        batch.append(messages.popleft())
+    return batch
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, dtm.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class MessageDispatcher:
+    """Очереди исходящих сообщений по чатам с общим и по-чатовым token bucket'ом."""
+
+    def __init__(  # noqa: PLR0913
+        self,
+        bot: Bot,
+        *,
+        global_rate: float = OUTBOX_GLOBAL_RATE,
+        chat_rate: float = OUTBOX_CHAT_RATE,
+        chat_burst: float = OUTBOX_CHAT_BURST,
+        merge_window: float = OUTBOX_MERGE_WINDOW,
+        max_pending: int = OUTBOX_MAX_PENDING,
+        backend: LimiterBackend | None = None,
+    ):
+        self.bot = bot
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.merge_window = merge_window
+        self.max_pending = max_pending
+        self._backend = backend
+        self.stats = OutboxStats()
+        self._chats: dict[int, _Chat] = {}
+        self._has_space = asyncio.Event()
+        self._has_space.set()
+        self._sends = 0
+        dispatchers.append(self)
+
+    @property
+    def backend(self) -> LimiterBackend:
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+    @property
+    def active_chats(self) -> int:
+        return sum(1 for chat in self._chats.values() if chat.messages)
+
+    async def send(self, chat_id: int, text: str, **kwargs: Any) -> None:
+        """Поставить сообщение в очередь чата. Параметры - как у `Bot.send_message`."""
+        await self._enqueue(chat_id, OutgoingMessage(text, kwargs, time.monotonic()))
+
+    async def send_document(
+        self, chat_id: int, document: Path, caption: str = "", **kwargs: Any
+    ) -> None:
+        """Поставить в очередь файл, после отправки (или отказа) он удаляется."""
+        kwargs.setdefault("filename", document.name)
+        await self._enqueue(
+            chat_id, OutgoingMessage(caption, kwargs, time.monotonic(), document=document)
+        )
+
+    async def _enqueue(self, chat_id: int, message: OutgoingMessage) -> None:
+        while self.stats.queued >= self.max_pending:
+            self._has_space.clear()
+            await self._has_space.wait()
+
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(self.chat_burst)
+        chat.messages.append(message)
+        self.stats.queued += 1
+        if chat.task is None or chat.task.done():
+            chat.task = asyncio.create_task(self._drain(chat_id, chat))
+
+        self._sends += 1
+        if self._sends % PRUNE_EVERY == 0:
+            self._prune()
+
+    async def _drain(self, chat_id: int, chat: _Chat) -> None:
+        while chat.messages:
+            delay = chat.messages[0].queued_at + self.merge_window - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._take_chat_token(chat)
+            await self._take_global_token()
+            batch = take_batch(chat.messages)
+            try:
+                await self._deliver(chat_id, batch)
+            except Exception:
+                # не ошибка Telegram (например, пропал файл выгрузки): пачка
+                # теряется, а очередь чата и счётчик продолжают жить
+                logger.exception("failed to deliver %s messages to chat %s", len(batch), chat_id)
+                self.stats.failed += len(batch)
+            finally:
+                self.stats.queued -= len(batch)
+                if self.stats.queued < self.max_pending:
+                    self._has_space.set()
+
+    async def _take_chat_token(self, chat: _Chat) -> None:
+        while True:
+            now = time.monotonic()
+            chat.tokens = min(
+                self.chat_burst, chat.tokens + (now - chat.updated_at) * self.chat_rate
+            )
+            chat.updated_at = now
+            if chat.tokens >= 1:
+                chat.tokens -= 1
+                return
+            await asyncio.sleep((1 - chat.tokens) / self.chat_rate)
+
+    async def _take_global_token(self) -> None:
+        # бакет может быть общим для процессов (SQLite), событием его не дождаться,
+        # а `take` сам говорит, сколько спать до следующего токена
+        while (wait := await self.backend.take("telegram", self.global_rate, 1)) > 0:  # noqa: ASYNC110
+            await asyncio.sleep(wait)
+
+    async def _deliver(self, chat_id: int, batch: list[OutgoingMessage]) -> None:
+        if batch[0].document is not None:
+            try:
+                await self._deliver_document(chat_id, batch[0])
+            finally:
+                batch[0].document.unlink(missing_ok=True)
+            return
+        text = MERGE_SEPARATOR.join(message.text for message in batch)
+        await self._retrying(
+            chat_id, batch, lambda: self.bot.send_message(chat_id, text, **batch[-1].kwargs)
+        )
+
+    async def _deliver_document(self, chat_id: int, message: OutgoingMessage) -> None:
+        document = message.document
+        # PTB всё равно читает файл в память, но пусть это будет не в event loop
+        data = await asyncio.to_thread(document.read_bytes)
+        await self._retrying(
+            chat_id,
+            [message],
+            lambda: self.bot.send_document(
+                chat_id, data, caption=message.text or None, **message.kwargs
+            ),
+        )
+
+    async def _retrying(
+        self,
+        chat_id: int,
+        batch: list[OutgoingMessage],
+        request: Callable[[], Awaitable[object]],
+    ) -> None:
+        network_attempts = 0
+        while True:
+            try:
+                await request()
+            except RetryAfter as e:
+                # флуд-контроль ничего не теряет: ждём сколько сказано, с разбросом,
+                # чтобы все отложенные чаты не вернулись в одну и ту же секунду
+                delay = retry_after_seconds(e) * random.uniform(1, 1.2)
+                self.stats.flood_waits += 1
+                logger.warning("flood control for chat %s, retry in %.1fs", chat_id, delay)
+                await asyncio.sleep(delay)
+            except BadRequest as e:
+                logger.warning("message to chat %s rejected: %s", chat_id, e)
+                break
+            except NetworkError as e:
+                network_attempts += 1
+                if network_attempts >= MAX_NETWORK_ATTEMPTS:
+                    logger.error(
+                        "giving up on chat %s after %s errors: %s", chat_id, network_attempts, e
+                    )
+                    break
+                self.stats.retries += 1
+                await asyncio.sleep(min(2**network_attempts, 30) * random.uniform(0.5, 1.5))
+            except TelegramError as e:
+                # например, пользователь заблокировал бота - повтор не поможет
+                logger.info("message to chat %s not delivered: %s", chat_id, e)
+                break
+            else:
+                now = time.monotonic()
+                self.stats.sent += 1
+                self.stats.merged += len(batch) - 1
+                for message in batch:
+                    self.stats.total_delay += now - message.queued_at
+                    self.stats.max_delay = max(self.stats.max_delay, now - message.queued_at)
+                return
+        self.stats.failed += len(batch)
+
+    def _prune(self) -> None:
+        # бакет, который успел наполниться, ничем не отличается от нового
+        now = time.monotonic()
+        refill = self.chat_burst / self.chat_rate
+        idle = [
+            chat_id
+            for chat_id, chat in self._chats.items()
+            if not chat.messages
+            and (chat.task is None or chat.task.done())
+            and now - chat.updated_at >= refill
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    async def close(self, deadline: float = STOP_TIMEOUT) -> None:
+        """Дождаться отправки всего, что уже стоит в очередях."""
+        tasks = [chat.task for chat in self._chats.values() if chat.task and not chat.task.done()]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=deadline)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning("%s messages not sent in %ss, dropped", self.stats.queued, deadline)
+        if self in dispatchers:
+            dispatchers.remove(self)
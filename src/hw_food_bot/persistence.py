@@ -0,0 +1,197 @@
+"""Состояния диалогов и `user_data`/`chat_data` PTB в общей SQLite-базе.
+
+Все воркеры пишут в один файл (WAL), поэтому перезапущенный воркер
+продолжает диалог с того шага, на котором остановился предыдущий.
+`bot_data` не сохраняется: там живут сервисы и соединения процесса, а
+`chat_data` бот не использует - иначе PTB держал бы по пустому словарю на
+каждый чат, который хоть раз написал боту.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from telegram.ext import BasePersistence, PersistenceInput
+from telegram.ext._utils.types import ConversationDict, ConversationKey
+
+from hw_food_bot.sharding import Shard
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ptb_data (
+    kind TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (kind, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ptb_conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    user_id INTEGER,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+"""
+
+
+class SQLitePersistence(BasePersistence[dict, dict, dict]):
+    """`BasePersistence` поверх SQLite, данные в JSON.
+
+    С `shard` поднимаются только пользователи своего шарда: остальных этот
+    процесс всё равно никогда не увидит. Изменения PTB отдаёт раз в
+    `update_interval` секунд, столько и может потеряться при падении воркера.
+
+    Таймеры `conversation_timeout` PTB не сохраняет, поэтому диалоги, которые
+    не менялись дольше `conversation_ttl` секунд, при загрузке удаляются.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        shard: Shard | None = None,
+        update_interval: float = 1,
+        conversation_ttl: float | None = None,
+    ):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = str(path)
+        self.shard = shard
+        self.conversation_ttl = conversation_ttl
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persistence")
+        self._conn: sqlite3.Connection | None = None
+
+    async def _run(self, func, *args):
+        if self._conn is None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._open)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _open(self) -> None:
+        if self._conn is not None:
+            return
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(ptb_conversations)")}
+        if "updated_at" not in columns:
+            # база до таймаутов диалогов: такие диалоги считаются давно брошенными
+            self._conn.execute(
+                "ALTER TABLE ptb_conversations ADD COLUMN updated_at REAL NOT NULL DEFAULT 0"
+            )
+        self._conn.commit()
+
+    def _owns(self, user_id: int | None) -> bool:
+        return self.shard is None or user_id is None or self.shard.owns(user_id)
+
+    def _load_data(self, kind: str) -> dict[int, dict]:
+        rows = self._conn.execute("SELECT id, data FROM ptb_data WHERE kind = ?", (kind,))
+        return {id_: json.loads(data) for id_, data in rows if self._owns(id_)}
+
+    def _save_data(self, kind: str, id_: int, data: dict) -> None:
+        with self._conn:
+            if data:
+                self._conn.execute(
+                    "INSERT INTO ptb_data (kind, id, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT(kind, id) DO UPDATE SET data = excluded.data",
+                    (kind, id_, json.dumps(data, ensure_ascii=False)),
+                )
+            else:
+                self._conn.execute("DELETE FROM ptb_data WHERE kind = ? AND id = ?", (kind, id_))
+
+    def _load_conversations(self, name: str) -> ConversationDict:
+        if self.conversation_ttl is not None:
+            with self._conn:
+                expired = self._conn.execute(
+                    "DELETE FROM ptb_conversations WHERE name = ? AND updated_at < ?",
+                    (name, time.time() - self.conversation_ttl),
+                ).rowcount
+            if expired:
+                logger.info("dropped %s expired %s conversations", expired, name)
+        rows = self._conn.execute(
+            "SELECT key, user_id, state FROM ptb_conversations WHERE name = ?", (name,)
+        )
+        return {
+            tuple(json.loads(key)): json.loads(state)
+            for key, user_id, state in rows
+            if self._owns(user_id)
+        }
+
+    def _save_conversation(self, name: str, key: ConversationKey, state: object | None) -> None:
+        # при per_user ключ диалога заканчивается id пользователя
+        user_id = key[-1] if key and isinstance(key[-1], int) else None
+        with self._conn:
+            if state is None:
+                self._conn.execute(
+                    "DELETE FROM ptb_conversations WHERE name = ? AND key = ?",
+                    (name, json.dumps(key)),
+                )
+            else:
+                self._conn.execute(
+                    "INSERT INTO ptb_conversations (name, key, user_id, state, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT(name, key) DO UPDATE SET "
+                    "state = excluded.state, updated_at = excluded.updated_at",
+                    (name, json.dumps(key), user_id, json.dumps(state), time.time()),
+                )
+
+    async def get_user_data(self) -> dict[int, dict]:
+        return await self._run(self._load_data, "user")
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        return await self._run(self._load_data, "chat")
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        return await self._run(self._load_conversations, name)
+
+    async def update_conversation(
+        self, name: str, key: ConversationKey, new_state: object | None
+    ) -> None:
+        await self._run(self._save_conversation, name, key, new_state)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        await self._run(self._save_data, "user", user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        await self._run(self._save_data, "chat", chat_id, data)
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._run(self._save_data, "user", user_id, {})
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self._run(self._save_data, "chat", chat_id, {})
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+        logger.debug("persistence flushed")
@@ -0,0 +1,100 @@
+"""Сэмплирующий профайлер потока event loop, включается без перезапуска.
+
+Фоновый поток с частотой `hz` снимает стек главного потока через
+`sys._current_frames()` и копит свёрнутые стеки (формат flamegraph.pl /
+speedscope). `SIGUSR2` включает и выключает сэмплирование, при выключении
+самые частые стеки пишутся в лог, а полный профиль - в `output`.
+
+Сигнал обрабатывается через `loop.add_signal_handler`, а остановка потока и
+запись профиля идут в `asyncio.to_thread`: профайлер, который ищет задержки
+event loop, сам его не останавливает.
+"""
+
+import asyncio
+import logging
+import signal
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class StackSampler:
+    def __init__(self, hz: float = 100, output: str | Path = "profile.folded"):
+        self.interval = 1 / hz
+        self.output = Path(output)
+        self.samples: Counter[str] = Counter()
+        self._target_thread = threading.main_thread().ident
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._stopping: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.samples.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        logger.info("stack sampling started at %.0f Hz", 1 / self.interval)
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.dump()
+
+    def toggle(self) -> None:
+        """Обработчик SIGUSR2, вызывается в event loop."""
+        if self._stopping is not None and not self._stopping.done():
+            return
+        if self.running:
+            self._stopping = asyncio.create_task(asyncio.to_thread(self.stop))
+        else:
+            self.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def dump(self) -> None:
+        total = sum(self.samples.values())
+        if not total:
+            return
+        with self.output.open("w") as f:
+            for stack, count in self.samples.items():
+                f.write(f"{stack} {count}\n")
+        top = "\n".join(
+            f"{count / total:6.1%} ...;{';'.join(stack.split(';')[-3:])}"
+            for stack, count in self.samples.most_common(10)
+        )
+        logger.info("%s samples written to %s, top stacks:\n%s", total, self.output, top)
+
+
+def install_sampler(hz: float, output: str | Path, enabled: bool = False) -> StackSampler:
+    """Повесить переключение на SIGUSR2, при `enabled` сразу начать сэмплировать.
+
+    Вызывается внутри работающего event loop.
+    """
+    sampler = StackSampler(hz, output)
+    if hasattr(signal, "SIGUSR2"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, sampler.toggle)
+    if enabled:
+        sampler.start()
+    return sampler
@@ -0,0 +1,254 @@
+"""Общий rate limiter для внешних API: очередь с приоритетами и дедлайнами.
+
+Вместо молчаливого отказа при исчерпании лимита вызывающий встаёт в ограниченную
+очередь и ждёт свой токен не дольше дедлайна. Состояние бакетов хранится в
+подключаемом бэкенде: в памяти процесса или в SQLite-файле, общем для воркеров.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Protocol
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # пользователь ждёт ответа, например /log_food
+    BACKGROUND = 1  # фоновые задачи, например обновление погоды
+
+
+DEFAULT_DEADLINES = {
+    Priority.INTERACTIVE: 10.0,
+    Priority.BACKGROUND: 120.0,
+}
+
+
+class RateLimitExceeded(Exception):
+    """Токен не получен: очередь переполнена или истёк дедлайн."""
+
+
+class LimiterBackend(Protocol):
+    async def take(self, name: str, max_rate: float, time_period: float) -> float:
+        """Взять токен. Вернуть 0, если получилось, иначе сколько секунд ждать."""
+
+
+class InMemoryBackend:
+    """Token bucket в памяти процесса."""
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    async def take(self, name: str, max_rate: float, time_period: float) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(name, (max_rate, now))
+        rate = max_rate / time_period
+        tokens = min(max_rate, tokens + (now - updated_at) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[name] = (tokens, now)
+        return wait
+
+
+class SQLiteBackend:
+    """Token bucket в SQLite: один лимит на все процессы, открывшие файл."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets "
+            "(name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    async def take(self, name: str, max_rate: float, time_period: float) -> float:
+        return await asyncio.to_thread(self._take, name, max_rate, time_period)
+
+    def _take(self, name: str, max_rate: float, time_period: float) -> float:
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_buckets WHERE name = ?", (name,)
+                ).fetchone()
+                # между процессами монотонных часов нет, поэтому время - настенное
+                now = time.time()
+                tokens, updated_at = row or (max_rate, now)
+                rate = max_rate / time_period
+                tokens = min(max_rate, tokens + max(now - updated_at, 0) * rate)
+                wait = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / rate
+                conn.execute(
+                    "INSERT INTO rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, "
+                    "updated_at = excluded.updated_at",
+                    (name, tokens, now),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return wait
+
+
+@dataclass
+class RateLimiterStats:
+    queue_depth: int = 0
+    acquired: int = 0
+    timeouts: int = 0
+    rejected: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+
+class RateLimiter:
+    """Лимит `max_rate` запросов за `time_period` секунд с очередью ожидания.
+
+    Очередь упорядочена по приоритету, внутри приоритета - FIFO. Если очередь
+    полна, более срочный вызов вытесняет из неё ожидающего с самым низким
+    приоритетом и самым поздним дедлайном.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_rate: float,
+        time_period: float,
+        backend: LimiterBackend | None = None,
+        max_queue: int = 100,
+    ):
+        self.name = name
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._backend = backend
+        self.max_queue = max_queue
+        self.stats = RateLimiterStats()
+        # (приоритет, порядковый номер, момент дедлайна, future)
+        self._queue: list[tuple[int, int, float, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._dispatcher: asyncio.Task | None = None
+
+    @property
+    def backend(self) -> LimiterBackend:
+        # выбирается при первом запросе, когда окружение уже загружено
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+    async def acquire(
+        self, priority: Priority = Priority.INTERACTIVE, deadline: float | None = None
+    ) -> None:
+        """Дождаться токена или выбросить `RateLimitExceeded`."""
+        if deadline is None:
+            deadline = DEFAULT_DEADLINES[priority]
+        started = time.monotonic()
+
+        if not self._queue:
+            wait = await self.backend.take(self.name, self.max_rate, self.time_period)
+            if wait == 0:
+                self._record_wait(started)
+                return
+
+        if self.stats.queue_depth >= self.max_queue and not self._evict(priority):
+            self.stats.rejected += 1
+            logger.warning("%s limiter queue is full (%s)", self.name, self.max_queue)
+            raise RateLimitExceeded(f"{self.name}: queue is full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._counter), started + deadline, future))
+        self.stats.queue_depth += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        try:
+            await asyncio.wait_for(future, deadline)
+        except TimeoutError:
+            self.stats.timeouts += 1
+            logger.warning("%s limiter deadline of %.1fs exceeded", self.name, deadline)
+            raise RateLimitExceeded(f"{self.name}: deadline exceeded") from None
+        finally:
+            if not future.done() or future.cancelled():
+                self.stats.queue_depth -= 1
+        self._record_wait(started)
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, *exc) -> None:
+        return None
+
+    def _evict(self, priority: Priority) -> bool:
+        """Отказать ожидающему с приоритетом ниже `priority`, освободив место."""
+        waiting = [entry for entry in self._queue if not entry[3].done()]
+        if not waiting:
+            return False
+        victim = max(waiting, key=lambda entry: (entry[0], entry[2]))
+        if victim[0] <= priority:
+            return False
+        # из кучи его уберёт диспетчер, как и ушедших по дедлайну
+        victim[3].set_exception(RateLimitExceeded(f"{self.name}: evicted from a full queue"))
+        self.stats.queue_depth -= 1
+        self.stats.rejected += 1
+        logger.warning("%s limiter queue is full, evicted a waiter", self.name)
+        return True
+
+    def _record_wait(self, started: float) -> None:
+        waited = time.monotonic() - started
+        self.stats.acquired += 1
+        self.stats.total_wait += waited
+        self.stats.max_wait = max(self.stats.max_wait, waited)
+
+    async def _dispatch(self) -> None:
+        while self._queue:
+            if self._queue[0][3].done():
+                # ожидающий ушёл по дедлайну или вытеснен
+                heapq.heappop(self._queue)
+                continue
+            wait = await self.backend.take(self.name, self.max_rate, self.time_period)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            while self._queue and self._queue[0][3].done():
+                heapq.heappop(self._queue)
+            if not self._queue:
+                # токен уже взят, но отдавать некому - вернуть его нельзя, это ок
+                break
+            *_, future = heapq.heappop(self._queue)
+            self.stats.queue_depth -= 1
+            future.set_result(None)
+
+
+_backend: LimiterBackend | None = None
+limiters: dict[str, RateLimiter] = {}
+
+
+def get_backend() -> LimiterBackend:
+    """Бэкенд по умолчанию: SQLite, если задан `RATE_LIMIT_DB`, иначе память."""
+    global _backend  # noqa: PLW0603
+    if _backend is None:
+        path = os.getenv("RATE_LIMIT_DB")
+        _backend = SQLiteBackend(path) if path else InMemoryBackend()
+    return _backend
+
+
+def get_limiter(name: str, max_rate: float, time_period: float) -> RateLimiter:
+    """Общий на процесс лимитер с именем `name`."""
+    if name not in limiters:
+        limiters[name] = RateLimiter(name, max_rate, time_period)
+    return limiters[name]
@@ -0,0 +1,229 @@
+"""Напоминания выпить воды тем, кто отстаёт от дневной цели.
+
+Все пользователи лежат в одном timing wheel: кольце из `REMINDER_HORIZON /
+REMINDER_TICK` ячеек, где в каждой ячейке - массив id тех, кого пора
+проверить в этот тик. Одна задача раз в тик забирает очередную ячейку и
+проверяет её пачками по `REMINDER_BATCH_SIZE`; каждый проверенный тут же
+кладётся в ячейку следующей проверки. Так на пользователя приходится одна
+запись в 8 байт, а не задача или job в `JobQueue`.
+
+Проверка смотрит на `UserProgress` и `UserDailyGoals`: к этому часу местного
+дня должна быть выпита доля цели, пропорциональная прошедшей части
+"дневного окна" `REMINDER_DAY_START`-`REMINDER_DAY_END`. Вне окна (тихие
+часы по часовому поясу города) проверка откладывается до утра, а пока часовой
+пояс города неизвестен - на обычный интервал. Отправка идёт
+через `MessageDispatcher`, но не чаще `REMINDER_RATE` в секунду, чтобы
+напоминания не отнимали лимит у ответов на команды.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from array import array
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING
+
+from hw_food_bot.outbox import OUTBOX_GLOBAL_RATE, MessageDispatcher
+from hw_food_bot.rate_limit import LimiterBackend, get_backend
+
+if TYPE_CHECKING:
+    # calories_math импортирует metrics, а metrics - этот модуль
+    from hw_food_bot.calories_math import UserDailyGoals, UserProgress, WeatherService
+    from hw_food_bot.storage import UserStore
+
+logger = logging.getLogger(__name__)
+
+REMINDERS = os.getenv("REMINDERS", "1") == "1"
+# местные часы, между которыми можно напоминать
+REMINDER_DAY_START = int(os.getenv("REMINDER_DAY_START", "9"))
+REMINDER_DAY_END = int(os.getenv("REMINDER_DAY_END", "22"))
+# как часто проверять того, кто не отстаёт, и как часто напоминать тому, кто отстаёт
+REMINDER_CHECK_INTERVAL = float(os.getenv("REMINDER_CHECK_INTERVAL", "1800"))
+REMINDER_INTERVAL = float(os.getenv("REMINDER_INTERVAL", "7200"))
+# насколько (мл) нужно отстать от графика, чтобы получить напоминание
+REMINDER_MIN_DEFICIT = float(os.getenv("REMINDER_MIN_DEFICIT", "250"))
+# напоминаниям - не больше половины общего лимита бота
+REMINDER_RATE = float(os.getenv("REMINDER_RATE", str(OUTBOX_GLOBAL_RATE / 2)))
+REMINDER_BATCH_SIZE = 500
+REMINDER_TICK = 60.0
+# дальше этого срока проверка не откладывается: столько покрывает кольцо
+REMINDER_HORIZON = 24 * 60 * 60.0
+
+DAY = 24 * 60 * 60
+
+# все планировщики процесса, для метрик
+schedulers: list["ReminderScheduler"] = []
+
+
+@dataclass(frozen=True, slots=True)
+class WaterCheck:
+    remind: bool
+    next_check: float
+    expected: float = 0
+
+
+@dataclass
+class ReminderStats:
+    checked: int = 0
+    sent: int = 0
+    muted: int = 0
+
+
+def check_water(
+    progress: "UserProgress",
+    goals: "UserDailyGoals | None",
+    utc_offset: int | None,
+    now: float,
+) -> WaterCheck:
+    """Напоминать ли сейчас и когда проверить в следующий раз."""
+    if utc_offset is None:
+        # без часового пояса не понять, не ночь ли у пользователя; смещение
+        # появится из базы или с очередным ответом погоды
+        return WaterCheck(False, now + REMINDER_CHECK_INTERVAL)
+    start, end = REMINDER_DAY_START * 3600, REMINDER_DAY_END * 3600
+    local_seconds = (now + utc_offset) % DAY
+    # утро у всего часового пояса наступает разом, поэтому проверки размазываются
+    next_morning = now + (start - local_seconds) % DAY + random.uniform(0, REMINDER_CHECK_INTERVAL)
+    if not start <= local_seconds < end:
+        return WaterCheck(False, next_morning)
+    if goals is None or progress.logged_water >= goals.water_goal:
+        return WaterCheck(False, next_morning)
+    # местная дата, как в `local_day`
+    if progress.day != datetime.fromtimestamp(now + utc_offset, UTC).date().isoformat():
+        # смена дня ещё не дошла до пользователя, вчерашний прогресс не в счёт
+        return WaterCheck(False, now + REMINDER_CHECK_INTERVAL)
+
+    expected = goals.water_goal * (local_seconds - start) / (end - start)
+    if expected - progress.logged_water >= REMINDER_MIN_DEFICIT:
+        return WaterCheck(True, now + REMINDER_INTERVAL, expected)
+    return WaterCheck(False, now + REMINDER_CHECK_INTERVAL)
+
+
+def reminder_text(progress: "UserProgress", goals: "UserDailyGoals", expected: float) -> str:
+    return (
+        f"Не забудьте про воду: выпито {progress.logged_water} мл из {goals.water_goal:.0f}, "
+        f"к этому часу стоило бы около {expected:.0f} мл.\n"
+        "Записать - /log_water <мл>, выключить напоминания - /reminders off"
+    )
+
+
+class ReminderScheduler:
+    """Timing wheel проверок и одна задача, которая его крутит."""
+
+    def __init__(  # noqa: PLR0913
+        self,
+        user_store: "UserStore",
+        weather_service: "WeatherService",
+        outbox: MessageDispatcher,
+        *,
+        muted: Callable[[int], bool] = lambda user_id: False,
+        tick: float = REMINDER_TICK,
+        horizon: float = REMINDER_HORIZON,
+        batch_size: int = REMINDER_BATCH_SIZE,
+        rate: float = REMINDER_RATE,
+        backend: LimiterBackend | None = None,
+    ):
+        self.user_store = user_store
+        self.weather_service = weather_service
+        self.outbox = outbox
+        self.muted = muted
+        self.tick = tick
+        self.batch_size = batch_size
+        self.rate = rate
+        self._backend = backend
+        self.stats = ReminderStats()
+        self._slots = [array("q") for _ in range(int(horizon // tick))]
+        self._cursor = int(time.time() // tick)
+        self._scheduled = 0
+        self._task: asyncio.Task | None = None
+        schedulers.append(self)
+
+    @property
+    def backend(self) -> LimiterBackend:
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+    def __len__(self) -> int:
+        return self._scheduled
+
+    def add(self, user_ids: Iterable[int], now: float | None = None) -> None:
+        """Поставить новых пользователей на первую проверку в течение `REMINDER_CHECK_INTERVAL`."""
+        now = time.time() if now is None else now
+        for user_id in user_ids:
+            self.schedule(user_id, now + random.uniform(0, REMINDER_CHECK_INTERVAL))
+
+    def schedule(self, user_id: int, at: float) -> None:
+        tick = min(max(int(at // self.tick), self._cursor + 1), self._cursor + len(self._slots) - 1)
+        self._slots[tick % len(self._slots)].append(user_id)
+        self._scheduled += 1
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self in schedulers:
+            schedulers.remove(self)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.advance(time.time())
+            except Exception:
+                logger.exception("reminder tick failed")
+            await asyncio.sleep(max((self._cursor + 1) * self.tick - time.time(), 0))
+
+    async def advance(self, now: float) -> int:
+        """Проверить все ячейки до момента `now`, вернуть число отправленных напоминаний."""
+        current = int(now // self.tick)
+        # после долгой паузы (сон машины) достаточно пройти кольцо один раз
+        self._cursor = max(self._cursor, current - len(self._slots))
+        sent = 0
+        while self._cursor < current:
+            self._cursor += 1
+            index = self._cursor % len(self._slots)
+            user_ids, self._slots[index] = self._slots[index], array("q")
+            self._scheduled -= len(user_ids)
+            for start in range(0, len(user_ids), self.batch_size):
+                sent += await self._check_batch(user_ids[start : start + self.batch_size], now)
+                # пачка - это миллисекунды, дальше event loop нужен хендлерам
+                await asyncio.sleep(0)
+        return sent
+
+    async def _check_batch(self, user_ids: array, now: float) -> int:
+        due = []
+        for user_id in user_ids:
+            user = self.user_store.peek(user_id)
+            if user is None:
+                # пользователя нет в памяти этого процесса - больше не проверяем
+                continue
+            progress, goals = user.progress, user.goals
+            check = check_water(
+                progress, goals, self.weather_service.utc_offset(user.profile.city), now
+            )
+            self.schedule(user_id, check.next_check)
+            if not check.remind:
+                continue
+            if self.muted(user_id):
+                self.stats.muted += 1
+                continue
+            due.append((user_id, reminder_text(progress, goals, check.expected)))
+        self.stats.checked += len(user_ids)
+
+        for user_id, text in due:
+            # как в `MessageDispatcher`: бакет может быть общим для процессов
+            while (wait := await self.backend.take("reminders", self.rate, 1)) > 0:  # noqa: ASYNC110
+                await asyncio.sleep(wait)
+            await self.outbox.send(user_id, text)
+            self.stats.sent += 1
+        if due:
+            logger.debug("sent %s water reminders", len(due))
+        return len(due)
@@ -0,0 +1,142 @@
+"""Таймауты и circuit breaker для внешних API.
+
+После `failure_threshold` ошибок подряд цепь размыкается: вызовы сразу
+получают `CircuitOpen`, не занимая лимит API и не заставляя пользователя
+ждать таймаута. Через `reset_timeout` секунд пропускается один пробный
+вызов (half-open): успех замыкает цепь, ошибка снова размыкает.
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(Exception):
+    """Внешний API не ответил вовремя, вернул ошибку или цепь разомкнута."""
+
+
+class UpstreamError(UpstreamUnavailable):
+    """Ответ 5xx или 429 от внешнего API."""
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+class BreakerState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+@dataclass
+class BreakerStats:
+    failures: int = 0
+    timeouts: int = 0
+    rejected: int = 0
+    opened: int = 0
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = BreakerState.CLOSED
+        self.stats = BreakerStats()
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def raise_if_open(self) -> None:
+        """Быстрая проверка до ожидания лимита: цепь разомкнута и пробовать рано."""
+        if (
+            self.state is BreakerState.OPEN
+            and time.monotonic() - self._opened_at < self.reset_timeout
+        ):
+            self.stats.rejected += 1
+            raise CircuitOpen(self.name)
+
+    # таймаут внутри, а не у вызывающего: истёкший таймаут - это отказ для цепи
+    async def call(self, func: Callable[[], Awaitable[Any]], timeout: float) -> Any:  # noqa: ASYNC109
+        """Выполнить `func()` не дольше `timeout` секунд с учётом состояния цепи.
+
+        Любая ошибка вызова превращается в `UpstreamUnavailable`.
+        """
+        self._enter()
+        try:
+            async with asyncio.timeout(timeout):
+                result = await func()
+        except asyncio.CancelledError:
+            self._probing = False
+            raise
+        except TimeoutError as e:
+            self.stats.timeouts += 1
+            self._on_failure()
+            raise UpstreamUnavailable(f"{self.name}: no response in {timeout}s") from e
+        except UpstreamUnavailable:
+            self._on_failure()
+            raise
+        except Exception as e:
+            self._on_failure()
+            raise UpstreamUnavailable(f"{self.name}: {e!r}") from e
+        self._on_success()
+        return result
+
+    def _enter(self) -> None:
+        if self.state is BreakerState.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                self.stats.rejected += 1
+                raise CircuitOpen(self.name)
+            self.state = BreakerState.HALF_OPEN
+        if self.state is BreakerState.HALF_OPEN:
+            # пока идёт пробный вызов, остальные не пускаем
+            if self._probing:
+                self.stats.rejected += 1
+                raise CircuitOpen(self.name)
+            self._probing = True
+
+    def _on_success(self) -> None:
+        self._consecutive_failures = 0
+        self._probing = False
+        if self.state is not BreakerState.CLOSED:
+            self.state = BreakerState.CLOSED
+            logger.info("%s: circuit closed", self.name)
+
+    def _on_failure(self) -> None:
+        self.stats.failures += 1
+        self._consecutive_failures += 1
+        self._probing = False
+        if (
+            self.state is BreakerState.HALF_OPEN
+            or self._consecutive_failures >= self.failure_threshold
+        ):
+            if self.state is not BreakerState.OPEN:
+                self.stats.opened += 1
+                logger.warning(
+                    "%s: circuit opened after %s failures, retry in %.0fs",
+                    self.name,
+                    self._consecutive_failures,
+                    self.reset_timeout,
+                )
+            self.state = BreakerState.OPEN
+            self._opened_at = time.monotonic()
+
+
+# все breaker'ы процесса по имени, для метрик
+breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(
+    name: str, failure_threshold: int = 5, reset_timeout: float = 30.0
+) -> CircuitBreaker:
+    """Общий на процесс breaker с именем `name`."""
+    if name not in breakers:
+        breakers[name] = CircuitBreaker(name, failure_threshold, reset_timeout)
+    return breakers[name]
@@ -0,0 +1,70 @@
+"""Время жизни диалогов и `user_data`: брошенный на полпути диалог не живёт вечно.
+
+Диалог, в котором пользователь молчит `CONVERSATION_TIMEOUT` секунд, PTB
+завершает сам, а колбэк из `timeout_handlers` убирает из `user_data` ключи
+этого диалога. Опустевшая запись пользователя удаляется целиком, так что
+память растёт с числом активных диалогов, а не со всеми, кто писал боту.
+
+PTB после каждого апдейта пересоздаёт пустой `user_data` автора (так он
+сохраняет его в persistence), поэтому раз в `SESSION_SWEEP_INTERVAL` секунд
+пустые записи подчищаются отдельной задачей.
+"""
+
+import logging
+import os
+from collections.abc import Iterable
+
+from telegram import Update
+from telegram.ext import Application, BaseHandler, CallbackContext, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+# сколько ждать ответа в диалоге, 0 - ждать вечно
+CONVERSATION_TIMEOUT = float(os.getenv("CONVERSATION_TIMEOUT", "900"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+
+
+def end_session(context: CallbackContext, user_id: int, keys: Iterable[str]) -> None:
+    """Убрать ключи завершённого диалога, а пустую запись пользователя - целиком."""
+    user_data = context.application.user_data.get(user_id)
+    if user_data is None:
+        return
+    for key in keys:
+        user_data.pop(key, None)
+    if not user_data:
+        context.application.drop_user_data(user_id)
+
+
+def timeout_handlers(name: str, keys: Iterable[str]) -> list[BaseHandler]:
+    """Хендлеры состояния `ConversationHandler.TIMEOUT` для диалога `name`."""
+    keys = tuple(keys)
+
+    async def expire(update: Update, context: CallbackContext) -> None:
+        end_session(context, update.effective_user.id, keys)
+        logger.debug("%s conversation of user %s timed out", name, update.effective_user.id)
+
+    expire.__name__ = f"{name}_timeout"
+    return [TypeHandler(Update, expire)]
+
+
+def schedule_session_sweep(application: Application) -> None:
+    application.job_queue.run_repeating(
+        sweep_sessions,
+        interval=SESSION_SWEEP_INTERVAL,
+        first=SESSION_SWEEP_INTERVAL,
+        name="session_sweep",
+    )
+
+
+async def sweep_sessions(context: CallbackContext) -> None:
+    dropped = drop_empty_sessions(context.application)
+    if dropped:
+        logger.debug("dropped %s empty user_data entries", dropped)
+
+
+def drop_empty_sessions(application: Application) -> int:
+    """Удалить пустые записи `user_data`, вернуть их число."""
+    empty = [user_id for user_id, data in application.user_data.items() if not data]
+    for user_id in empty:
+        application.drop_user_data(user_id)
+    return len(empty)
@@ -1,19 +1,142 @@
+import atexit
+import json
 import logging
+import queue
 import sys
+from datetime import UTC, datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import TextIO
 
+# сколько строк максимум уходит в stdout одним write
+LOG_BATCH_SIZE = 256
 
-def setup_logging(level: str | None = None) -> None:
-    """Setup logging configuration for the entire application."""
+# атрибуты, которые есть у любой записи; всё остальное - это `extra=`
+_RECORD_ATTRS = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {
+    "message",
+    "asctime",
+    "taskName",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON, поля из `extra=` попадают в неё как есть."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, UTC).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            data["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """`QueueHandler`, который не форматирует запись в потоке логгера.
+
+    Стандартный `prepare` собирает сообщение сразу, то есть в event loop;
+    здесь запись уходит в очередь как есть, а `%`-подстановка и JSON
+    делаются в потоке `QueueListener`. Очередь в памяти процесса, так что
+    pickle записи не нужен.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class BatchingStreamHandler(logging.StreamHandler):
+    """Копит строки, пока в очереди есть ещё записи, и пишет их одним `write`.
+
+    Под нагрузкой это сотни записей за системный вызов, а в тишине запись
+    уходит сразу: очередь пуста - буфер сбрасывается.
+    """
+
+    def __init__(
+        self,
+        records: queue.SimpleQueue,
+        stream: TextIO | None = None,
+        batch_size: int = LOG_BATCH_SIZE,
+    ):
+        super().__init__(stream)
+        self.records = records
+        self.batch_size = batch_size
+        self._buffer: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self._buffer.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self._buffer) >= self.batch_size or self.records.empty():
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if self._buffer:
+                lines, self._buffer = self._buffer, []
+                self.stream.write(self.terminator.join(lines) + self.terminator)
+            super().flush()
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Пропускает каждую `rate`-ю DEBUG-запись с одного места вызова (файл и строка).
+
+    Отброшенная запись не доходит до очереди и не форматируется вовсе.
+    """
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = rate
+        self._seen: dict[tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        key = (record.pathname, record.lineno)
+        seen = self._seen.get(key, 0)
+        self._seen[key] = seen + 1
+        if seen % self.rate:
+            return False
+        record.sampled = self.rate
+        return True
+
+
+def setup_logging(level: str | None = None, fmt: str = "text", debug_sample: int = 1) -> None:
+    """Setup logging configuration for the entire application.
+
+    `fmt="json"` включает JSON-строки, которые форматируются и пишутся пачками
+    в отдельном потоке (`QueueListener`), а не в event loop. `debug_sample=N`
+    оставляет каждую N-ю DEBUG-запись с одного места.
+    """
 
     log_level = getattr(logging, level.upper()) if level else logging.INFO
 
-    logging.basicConfig(
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        level=log_level,
-        handlers=[
-            logging.StreamHandler(sys.stdout),
-        ],
-    )
+    if fmt == "json":
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        output = BatchingStreamHandler(records, sys.stdout)
+        output.setFormatter(JsonFormatter())
+        handler: logging.Handler = DeferredQueueHandler(records)
+        listener = QueueListener(records, output)
+        listener.start()
+        # остановка дописывает всё, что осталось в очереди
+        atexit.register(listener.stop)
+    else:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        )
+    if debug_sample > 1:
+        handler.addFilter(DebugSamplingFilter(debug_sample))
+
+    logging.basicConfig(level=log_level, handlers=[handler])
 
     logging.getLogger("httpx").setLevel(logging.WARNING)
 
@@ -0,0 +1,206 @@
+"""Несколько процессов-воркеров на один токен, апдейты делятся по `user_id`.
+
+Фронт (polling или вебхук) ничего не обрабатывает сам: каждый апдейт
+уходит в очередь воркера `user_id % N`. Если воркер упал, супервизор
+поднимает новый, и тот продолжает диалоги из общей базы
+(`SQLitePersistence`, `UserStore`). Теряются только апдейты, которые
+упавший воркер уже забрал из очереди.
+
+Апдейты нумеруются по шарду, а воркер отмечает номер последнего забранного в
+общей памяти. Фронт держит у себя ещё не забранные, и новый воркер получает
+их в свежей очереди: старую убитый посреди `get()` процесс мог оставить
+с захваченным замком.
+"""
+
+import asyncio
+import ctypes
+import logging
+import multiprocessing
+import os
+import signal
+from collections import deque
+from pathlib import Path
+from typing import NamedTuple
+
+from telegram import Update
+from telegram.ext import Application, CallbackContext, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+SUPERVISE_INTERVAL = 1.0
+STOP_TIMEOUT = 30.0
+
+
+class Shard(NamedTuple):
+    index: int
+    count: int
+
+    def owns(self, user_id: int) -> bool:
+        return user_id % self.count == self.index
+
+
+def shard_key(update: Update) -> int:
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return 0
+
+
+def run_worker(
+    shard: Shard, queue: multiprocessing.Queue, taken: ctypes.c_longlong, concurrent_updates: int
+) -> None:
+    """Точка входа процесса-воркера: приложение без Updater, апдейты из `queue`.
+
+    В `taken` пишется номер последнего забранного из очереди апдейта.
+    """
+    # Ctrl+C получает вся группа процессов, останавливает воркеров фронт
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if os.environ.get("METRICS_PORT"):
+        os.environ["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + 1 + shard.index)
+
+    # bot читает METRICS_PORT при импорте и сам импортирует этот модуль
+    from hw_food_bot.bot import build_application  # noqa: PLC0415
+
+    application = build_application(concurrent_updates, shard=shard)
+    asyncio.run(_serve(application, queue, taken))
+
+
+async def _serve(
+    application: Application, queue: multiprocessing.Queue, taken: ctypes.c_longlong
+) -> None:
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    shard = application.bot_data["shard"]
+    logger.info("worker %s/%s started", shard.index + 1, shard.count)
+    try:
+        while (item := await asyncio.to_thread(queue.get)) is not None:
+            seq, data = item
+            taken.value = seq
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        # stop() дорабатывает уже поставленные в очередь апдейты
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        logger.info("worker %s/%s stopped", shard.index + 1, shard.count)
+
+
+class WorkerPool:
+    """Процессы-воркеры с очередями и супервизор, перезапускающий упавших."""
+
+    def __init__(self, workers: int, concurrent_updates: int):
+        self.concurrent_updates = concurrent_updates
+        self._context = multiprocessing.get_context("spawn")
+        self.shards = [Shard(index, workers) for index in range(workers)]
+        self.queues = [self._context.Queue() for _ in self.shards]
+        # номер последнего апдейта, забранного воркером; пишет только воркер
+        self.taken = [self._context.Value("q", 0, lock=False) for _ in self.shards]
+        # отправленные воркеру, но, возможно, ещё не забранные им апдейты
+        self.unread: list[deque[tuple[int, dict]]] = [deque() for _ in self.shards]
+        self._seq = [0] * workers
+        self.processes: list[multiprocessing.Process | None] = [None] * workers
+        self.restarts = 0
+        self._supervisor: asyncio.Task | None = None
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=run_worker,
+            args=(
+                self.shards[index],
+                self.queues[index],
+                self.taken[index],
+                self.concurrent_updates,
+            ),
+            name=f"hw-food-bot-worker-{index}",
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self) -> None:
+        # без общего бэкенда каждый воркер расходовал бы квоту API отдельно
+        user_db = Path(os.environ.get("USER_DB", "users.db"))
+        os.environ.setdefault("RATE_LIMIT_DB", str(user_db.with_name("limits.db")))
+        for index in range(len(self.shards)):
+            self._spawn(index)
+        self._supervisor = asyncio.create_task(self._supervise())
+        logger.info("started %s workers", len(self.shards))
+
+    async def _supervise(self) -> None:
+        while True:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive():
+                    self.restarts += 1
+                    logger.error(
+                        "worker %s exited with code %s, restarting", index, process.exitcode
+                    )
+                    # убитый посреди get() процесс мог оставить замок очереди захваченным,
+                    # поэтому новый воркер получает новую очередь с тем, что не забрано
+                    self.queues[index].cancel_join_thread()
+                    self.queues[index].close()
+                    self.queues[index] = self._context.Queue()
+                    unread = self._forget_taken(index)
+                    for item in unread:
+                        self.queues[index].put(item)
+                    logger.info("re-routed %s unread updates to worker %s", len(unread), index)
+                    self._spawn(index)
+
+    def route(self, update: Update) -> None:
+        shard = shard_key(update) % len(self.shards)
+        self._seq[shard] += 1
+        item = (self._seq[shard], update.to_dict())
+        self._forget_taken(shard).append(item)
+        self.queues[shard].put(item)
+
+    def _forget_taken(self, index: int) -> deque[tuple[int, dict]]:
+        """Выбросить апдейты, которые воркер уже забрал, вернуть остальные."""
+        unread, taken = self.unread[index], self.taken[index].value
+        while unread and unread[0][0] <= taken:
+            unread.popleft()
+        return unread
+
+    async def stop(self) -> None:
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning("worker %s did not stop in time, terminating", process.name)
+                process.terminate()
+        logger.info("all workers stopped")
+
+
+async def _route(update: Update, context: CallbackContext) -> None:
+    context.bot_data["worker_pool"].route(update)
+
+
+def build_router(bot_token: str, workers: int, concurrent_updates: int) -> Application:
+    """Фронт-приложение: только принимает апдейты и раскладывает их по воркерам."""
+    pool = WorkerPool(workers, concurrent_updates)
+
+    async def post_init(application: Application) -> None:
+        pool.start()
+
+    async def post_shutdown(application: Application) -> None:
+        await pool.stop()
+
+    application = (
+        Application.builder()
+        .token(bot_token)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    application.bot_data["worker_pool"] = pool
+    application.add_handler(TypeHandler(Update, _route))
+    return application
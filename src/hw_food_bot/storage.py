@@ -0,0 +1,374 @@
+"""Хранилище пользователей: кэш в памяти и отложенная пакетная запись в SQLite."""
+
+import asyncio
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from functools import partial
+from pathlib import Path
+
+from hw_food_bot.calories_math import (
+    FoodService,
+    LoggedEvent,
+    UserDailyGoals,
+    UserManager,
+    UserProfile,
+    UserProgress,
+    WeatherService,
+)
+from hw_food_bot.sharding import Shard
+from hw_food_bot.weather_api import utc_offsets
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    profile TEXT NOT NULL,
+    goals TEXT,
+    progress TEXT NOT NULL,
+    current_weather REAL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    amount REAL NOT NULL,
+    calories REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_user_ts ON events (user_id, ts);
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    water REAL NOT NULL DEFAULT 0,
+    calories_in REAL NOT NULL DEFAULT 0,
+    calories_burned REAL NOT NULL DEFAULT 0,
+    events INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS city_offsets (
+    city TEXT PRIMARY KEY,
+    utc_offset INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+HISTORY_PAGE_SIZE = 7
+
+
+@dataclass
+class DailyRollup:
+    """Итоги одного дня пользователя, поддерживаются инкрементально."""
+
+    day: str
+    water: float = 0
+    calories_in: float = 0
+    calories_burned: float = 0
+    events: int = 0
+
+    def add(self, event: LoggedEvent) -> None:
+        self.events += 1
+        if event.kind == "water":
+            self.water += event.amount
+        elif event.kind == "food":
+            self.calories_in += event.calories
+        elif event.kind == "activity":
+            self.calories_burned += event.calories
+
+
+def event_day(event: LoggedEvent) -> str:
+    """Местный день события, для старых записей без него - день по UTC."""
+    return event.day or datetime.fromtimestamp(event.ts, UTC).date().isoformat()
+
+
+class UserStore:
+    """Асинхронный фасад над SQLite (WAL) для `UserManager`.
+
+    Изменения помечаются через `mark_dirty` и сбрасываются на диск одной транзакцией
+    раз в `flush_interval` секунд, так что серия `/log_water` - это одна запись.
+    Все обращения к диску идут через отдельный поток и не блокируют event loop.
+
+    Записи `LoggedEvent` дописываются в журнал `events`, а дневные итоги в
+    `daily_rollups` обновляются в той же транзакции, поэтому история по дням
+    читается без пересчёта сырых событий.
+
+    С `shard` в память поднимаются только пользователи этого шарда: база общая
+    для всех воркеров, но каждого пользователя обслуживает ровно один из них.
+
+    Смещения городов от UTC, которые процесс узнал из ответов погоды, тоже
+    сохраняются при сбросе: после рестарта смена дня и напоминания знают часовой
+    пояс, даже если API погоды ещё не ответил.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        weather_service: WeatherService,
+        food_service: FoodService,
+        flush_interval: float = 0.5,
+        shard: Shard | None = None,
+    ):
+        self.path = str(path)
+        self.weather_service = weather_service
+        self.food_service = food_service
+        self.flush_interval = flush_interval
+        self.shard = shard
+        self._users: dict[int, UserManager] = {}
+        self._by_city: dict[str, set[int]] = {}
+        self._dirty: set[int] = set()
+        self._events: list[tuple[int, LoggedEvent]] = []
+        self._saved_offsets: dict[str, int] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flush_task: asyncio.Task | None = None
+        # один поток - одно соединение, sqlite3 так не нужно синхронизировать
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-store")
+        self._conn: sqlite3.Connection | None = None
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def open(self) -> None:
+        self._saved_offsets = dict(await self._run(self._open))
+        for city, offset in self._saved_offsets.items():
+            # смещение, узнанное до открытия базы, свежее сохранённого
+            utc_offsets.setdefault(city, offset)
+        logger.info(
+            "user store opened at %s, %s city offsets known", self.path, len(self._saved_offsets)
+        )
+
+    def _open(self) -> list[tuple[str, int]]:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        return self._conn.execute("SELECT city, utc_offset FROM city_offsets").fetchall()
+
+    async def close(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush()
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
+        logger.info("user store closed")
+
+    async def get(self, user_id: int) -> UserManager | None:
+        if user_id in self._users:
+            return self._users[user_id]
+        row = await self._run(self._load, user_id)
+        if row is None:
+            return None
+        # пока читали с диска, пользователь мог появиться в кэше
+        if user_id not in self._users:
+            self._attach(user_id, self._from_row(row))
+        return self._users[user_id]
+
+    async def put(self, user_id: int, user: UserManager) -> None:
+        self._attach(user_id, user)
+        self.mark_dirty(user_id)
+
+    def _attach(self, user_id: int, user: UserManager) -> None:
+        user.event_sink = partial(self.append_event, user_id)
+        previous = self._users.get(user_id)
+        if previous is not None:
+            self._by_city.get(previous.profile.city, set()).discard(user_id)
+        self._users[user_id] = user
+        self._by_city.setdefault(user.profile.city, set()).add(user_id)
+
+    async def preload(self) -> int:
+        """Поднять всех пользователей в память, вернуть их количество."""
+        rows = await self._run(self._load_all)
+        for user_id, *row in rows:
+            if user_id not in self._users:
+                self._attach(user_id, self._from_row(row))
+        logger.info("preloaded %s users", len(rows))
+        return len(rows)
+
+    def user_ids(self) -> list[int]:
+        """id всех пользователей в памяти."""
+        return list(self._users)
+
+    def peek(self, user_id: int) -> UserManager | None:
+        """Пользователь из памяти, без чтения с диска."""
+        return self._users.get(user_id)
+
+    def cities(self) -> list[str]:
+        """Различные города пользователей в памяти."""
+        return [city for city, user_ids in self._by_city.items() if user_ids]
+
+    def users_in_city(self, city: str) -> list[tuple[int, UserManager]]:
+        return [(user_id, self._users[user_id]) for user_id in self._by_city.get(city, ())]
+
+    def mark_dirty(self, user_id: int) -> None:
+        self._dirty.add(user_id)
+        self._schedule()
+
+    def append_event(self, user_id: int, event: LoggedEvent) -> None:
+        self._events.append((user_id, event))
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_interval, self._schedule_flush)
+
+    def _schedule_flush(self) -> None:
+        self._flush_handle = None
+        self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        offset_rows = [
+            (city, offset)
+            for city, offset in utc_offsets.items()
+            if self._saved_offsets.get(city) != offset
+        ]
+        if not self._dirty and not self._events and not offset_rows:
+            return
+        dirty, self._dirty = self._dirty, set()
+        events, self._events = self._events, []
+        rows = [self._to_row(user_id, self._users[user_id]) for user_id in dirty]
+        event_rows = [
+            (user_id, e.ts, event_day(e), e.kind, e.name, e.amount, e.calories)
+            for user_id, e in events
+        ]
+        # сворачиваем события пачки в дельты по (пользователь, день)
+        rollups: dict[tuple[int, str], DailyRollup] = {}
+        for user_id, e in events:
+            day = event_day(e)
+            rollups.setdefault((user_id, day), DailyRollup(day)).add(e)
+        rollup_rows = [
+            (user_id, r.day, r.water, r.calories_in, r.calories_burned, r.events)
+            for (user_id, _), r in rollups.items()
+        ]
+        try:
+            # смещения пишутся идемпотентно, повтор после ошибки ничего не задвоит
+            await self._run(self._save_offsets, offset_rows)
+            await self._run(self._save, rows, event_rows, rollup_rows)
+        except Exception:
+            logger.exception("failed to flush %s users, will retry", len(rows))
+            self._dirty |= dirty
+            self._events = events + self._events
+            self._schedule()
+            return
+        self._saved_offsets.update(offset_rows)
+        logger.debug("flushed %s users, %s events", len(rows), len(event_rows))
+
+    async def archive_days(self, rows: list[tuple[int, str, float, float, float]]) -> None:
+        """Записать итоговые значения закрытых дней (user_id, day, вода, съедено, сожжено).
+
+        Итоги из прогресса главнее накопленных по событиям: так в историю попадают и
+        дни, начатые до журнала событий.
+        """
+        await self.flush()
+        await self._run(self._archive, rows)
+
+    async def get_history(self, user_id: int, page: int = 0) -> list[DailyRollup]:
+        """Страница дневных итогов, от свежих к старым."""
+        await self.flush()
+        rows = await self._run(self._load_history, user_id, page)
+        return [DailyRollup(*row) for row in rows]
+
+    async def count_history_days(self, user_id: int) -> int:
+        return await self._run(self._count_history_days, user_id)
+
+    def _load(self, user_id: int) -> tuple | None:
+        return self._conn.execute(
+            "SELECT profile, goals, progress, current_weather FROM users WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+
+    def _load_all(self) -> list[tuple]:
+        if self.shard is not None:
+            return self._conn.execute(
+                "SELECT user_id, profile, goals, progress, current_weather FROM users "
+                "WHERE user_id % ? = ?",
+                (self.shard.count, self.shard.index),
+            ).fetchall()
+        return self._conn.execute(
+            "SELECT user_id, profile, goals, progress, current_weather FROM users"
+        ).fetchall()
+
+    def _load_history(self, user_id: int, page: int) -> list[tuple]:
+        return self._conn.execute(
+            "SELECT day, water, calories_in, calories_burned, events FROM daily_rollups "
+            "WHERE user_id = ? ORDER BY day DESC LIMIT ? OFFSET ?",
+            (user_id, HISTORY_PAGE_SIZE, page * HISTORY_PAGE_SIZE),
+        ).fetchall()
+
+    def _count_history_days(self, user_id: int) -> int:
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM daily_rollups WHERE user_id = ?", (user_id,)
+        ).fetchone()[0]
+
+    def _archive(self, rows: list[tuple]) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO daily_rollups "
+                "(user_id, day, water, calories_in, calories_burned, events) "
+                "VALUES (?, ?, ?, ?, ?, 0) ON CONFLICT(user_id, day) DO UPDATE SET "
+                "water = excluded.water, calories_in = excluded.calories_in, "
+                "calories_burned = excluded.calories_burned",
+                rows,
+            )
+
+    def _save(self, rows: list[tuple], event_rows: list[tuple], rollup_rows: list[tuple]) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO events (user_id, ts, day, kind, name, amount, calories) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                event_rows,
+            )
+            self._conn.executemany(
+                "INSERT INTO daily_rollups "
+                "(user_id, day, water, calories_in, calories_burned, events) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(user_id, day) DO UPDATE SET "
+                "water = water + excluded.water, "
+                "calories_in = calories_in + excluded.calories_in, "
+                "calories_burned = calories_burned + excluded.calories_burned, "
+                "events = events + excluded.events",
+                rollup_rows,
+            )
+            self._conn.executemany(
+                "INSERT INTO users (user_id, profile, goals, progress, current_weather) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET "
+                "profile = excluded.profile, goals = excluded.goals, "
+                "progress = excluded.progress, current_weather = excluded.current_weather",
+                rows,
+            )
+
+    def _save_offsets(self, offset_rows: list[tuple]) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO city_offsets (city, utc_offset) VALUES (?, ?) "
+                "ON CONFLICT(city) DO UPDATE SET utc_offset = excluded.utc_offset",
+                offset_rows,
+            )
+
+    @staticmethod
+    def _to_row(user_id: int, user: UserManager) -> tuple:
+        return (
+            user_id,
+            json.dumps(asdict(user.profile), ensure_ascii=False),
+            json.dumps(asdict(user.goals)) if user.goals else None,
+            json.dumps(asdict(user.progress)),
+            user.current_weather,
+        )
+
+    def _from_row(self, row: tuple) -> UserManager:
+        profile, goals, progress, current_weather = row
+        user = UserManager(
+            UserProfile(**json.loads(profile)), self.weather_service, self.food_service
+        )
+        user.goals = UserDailyGoals(**json.loads(goals)) if goals else None
+        user.progress = UserProgress(**json.loads(progress))
+        user.current_weather = current_weather
+        return user
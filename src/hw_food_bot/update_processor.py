@@ -0,0 +1,66 @@
+"""Параллельная обработка апдейтов: разные чаты параллельно, один чат - по порядку."""
+
+import asyncio
+import sys
+from collections.abc import Awaitable
+from typing import Any
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Апдейты одного чата ждут друг друга, остальные обрабатываются одновременно.
+
+    Так медленный запрос в OpenFoodFacts у одного пользователя не задерживает
+    остальных, а ConversationHandler не видит шаги одного диалога вперемешку.
+
+    Семафор PTB берётся до `do_process_update`, и апдейты, ждущие замок своего
+    чата, занимали бы слоты всех остальных. Поэтому ему отдаётся заведомо
+    большой лимит, а настоящий держит свой семафор - только на время хендлера.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(sys.maxsize)
+        self.limit = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # замок и число ожидающих на чат, чтобы не копить замки всех чатов
+        self._locks: dict[int, tuple[asyncio.Lock, int]] = {}
+
+    @staticmethod
+    def _chat_key(update: object) -> int | None:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._chat_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        lock, waiters = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, waiters + 1)
+        try:
+            # сначала очередь своего чата, потом общий слот
+            async with lock, self._slots:
+                await coroutine
+        finally:
+            lock, waiters = self._locks[key]
+            if waiters == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, waiters - 1)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
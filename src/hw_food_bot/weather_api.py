@@ -1,14 +1,16 @@
-import json
 import logging
 import os
 
-from aiolimiter import AsyncLimiter
-from cachetools.func import ttl_cache
-from dotenv import find_dotenv, load_dotenv
-from niquests import AsyncSession
+from hw_food_bot.async_cache import async_cached
+from hw_food_bot.http_client import HttpClient
+from hw_food_bot.metrics import timed_upstream
+from hw_food_bot.offload import run_blocking
+from hw_food_bot.rate_limit import Priority, get_limiter
+from hw_food_bot.resilience import UpstreamError, get_breaker
 
-rate_limit = AsyncLimiter(max_rate=10, time_period=59)
-load_dotenv(find_dotenv())
+rate_limit = get_limiter("weather_api", max_rate=10, time_period=59)
+breaker = get_breaker("weather_api")
+WEATHER_API_TIMEOUT = float(os.getenv("WEATHER_API_TIMEOUT", "5"))
 
 
 logger = logging.getLogger(__name__)
@@ -16,24 +18,47 @@ logger = logging.getLogger(__name__)
 WEATHER_API_URL = "http://api.openweathermap.org/data/2.5/weather"
 API_KEY = os.environ.get("OPEN_WEATHER_TOKEN")
 
+# смещение от UTC в секундах по городам, из поля `timezone` ответа OpenWeather
+utc_offsets: dict[str, int] = {}
 
-# TTL: 10 hours
-@ttl_cache(maxsize=1024, ttl=10 * 60 * 60)
-async def get_current_weather(city: str) -> float | None:
-    params = {"q": city, "appid": API_KEY, "units": "metric"}
 
-    if rate_limit.has_capacity():
-        async with rate_limit:
-            logger.info("call for weather of: " + city)
-            async with AsyncSession() as s:
-                response = await s.get(WEATHER_API_URL, params=params)
-    else:
-        logger.info("weather api is over the limit")
-        return None
-    data = response.json()
+# TTL: 10 hours, город не найден - 10 минут, при недоступном API - старая погода ещё сутки
+@async_cached(
+    maxsize=1024,
+    ttl=10 * 60 * 60,
+    negative_ttl=10 * 60,
+    key=lambda city, *_, **__: city,
+    stale_ttl=24 * 60 * 60,
+    refresh_ahead=0.1,
+)
+@timed_upstream("weather")
+async def get_current_weather(
+    city: str,
+    client: HttpClient,
+    api_url: str = WEATHER_API_URL,
+    priority: Priority = Priority.INTERACTIVE,
+) -> float | None:
+    """Текущая температура в городе.
+
+    `RateLimitExceeded`, если не дождались лимита, `UpstreamUnavailable`, если
+    API не ответил за `WEATHER_API_TIMEOUT` или цепь разомкнута.
+    """
+    breaker.raise_if_open()
+    await rate_limit.acquire(priority)
+    logger.info("call for weather of: %s", city)
+    return await breaker.call(lambda: fetch_weather(city, client, api_url), WEATHER_API_TIMEOUT)
+
+
+async def fetch_weather(city: str, client: HttpClient, api_url: str) -> float | None:
+    params = {"q": city, "appid": API_KEY, "units": "metric"}
+    response = await client.get(api_url, params=params)
+    if response.status_code >= 500 or response.status_code == 429:  # noqa: PLR2004
+        raise UpstreamError(f"weather api returned {response.status_code}")
+    data = await run_blocking(response.json)
 
     if response.status_code != 200:  # noqa: PLR2004
-        logger.error("error while getting weather: " + json.dumps(data))
+        logger.error("error while getting weather: %s", data)
         return None
 
+    utc_offsets[city] = data.get("timezone", 0)
     return data["main"]["temp"]
@@ -0,0 +1,68 @@
+"""Фоновое обновление погоды по городам пользователей через JobQueue."""
+
+import logging
+import os
+
+from telegram.ext import Application, CallbackContext
+
+from hw_food_bot.rate_limit import Priority
+from hw_food_bot.weather_api import rate_limit
+
+logger = logging.getLogger(__name__)
+
+WEATHER_REFRESH_INTERVAL = float(os.getenv("WEATHER_REFRESH_INTERVAL", "3600"))
+# фоновому обновлению отдаём не больше половины лимита API
+BACKGROUND_BUDGET_SHARE = 0.5
+JOB_PREFIX = "weather_refresh:"
+
+
+def schedule_weather_refresh(application: Application) -> None:
+    application.job_queue.run_repeating(
+        plan_weather_refresh,
+        interval=WEATHER_REFRESH_INTERVAL,
+        first=min(60.0, WEATHER_REFRESH_INTERVAL),
+        name="weather_refresh",
+    )
+
+
+async def plan_weather_refresh(context: CallbackContext) -> None:
+    """Разложить уникальные города по интервалу обновления с учётом лимита API."""
+    job_queue = context.job_queue
+    in_flight = {
+        job.name.removeprefix(JOB_PREFIX)
+        for job in job_queue.jobs()
+        if job.name and job.name.startswith(JOB_PREFIX)
+    }
+    cities = [city for city in context.bot_data["user_store"].cities() if city not in in_flight]
+    if not cities:
+        return
+
+    min_spacing = rate_limit.time_period / (rate_limit.max_rate * BACKGROUND_BUDGET_SHARE)
+    spacing = max(min_spacing, WEATHER_REFRESH_INTERVAL / len(cities))
+    for i, city in enumerate(cities):
+        job_queue.run_once(refresh_city, when=i * spacing, data=city, name=JOB_PREFIX + city)
+    logger.info(
+        "scheduled weather refresh of %s cities every %.1fs (%s still pending)",
+        len(cities),
+        spacing,
+        len(in_flight),
+    )
+
+
+async def refresh_city(context: CallbackContext) -> None:
+    """Обновить погоду одного города и пересчитать цели всех его пользователей."""
+    city = context.job.data
+    temperature = await context.bot_data["weather_service"].refresh_weather(
+        city, priority=Priority.BACKGROUND
+    )
+    if temperature is None:
+        logger.info("weather refresh for %s failed, keeping previous value", city)
+        return
+
+    user_store = context.bot_data["user_store"]
+    users = user_store.users_in_city(city)
+    for user_id, user in users:
+        if user.current_weather != temperature:
+            user.update_weather(temperature)
+            user_store.mark_dirty(user_id)
+    logger.debug("weather in %s is %s, %s users updated", city, temperature, len(users))
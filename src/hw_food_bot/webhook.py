@@ -0,0 +1,156 @@
+"""Режим вебхука: минимальное ASGI-приложение поверх uvicorn.
+
+Telegram присылает апдейты POST-запросами, они кладутся в `update_queue`
+приложения, а обрабатываются параллельно через `PerChatUpdateProcessor`.
+При остановке новые апдейты получают 503 (Telegram их повторит), а уже
+принятые дорабатываются до конца.
+
+Секрет вебхука задаётся снаружи (`WEBHOOK_SECRET`): за балансировщиком все
+реплики должны проверять один и тот же токен, с которым вебхук зарегистрирован.
+"""
+
+import json
+import logging
+import secrets
+
+import uvicorn
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = b"x-telegram-bot-api-secret-token"
+
+
+class WebhookApp:
+    """ASGI-приложение: `POST <path>` для апдейтов и `GET /healthz`."""
+
+    def __init__(
+        self,
+        application: Application,
+        webhook_url: str | None,
+        secret_token: str,
+        path: str = "/telegram",
+    ):
+        if not secret_token:
+            raise ValueError("webhook secret token is required")
+        self.application = application
+        self.webhook_url = webhook_url
+        self.path = path
+        self.secret_token = secret_token
+        self.accepting = False
+        # stop и post_stop имеют смысл, только если startup дошёл до конца
+        self._started = False
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.exception("webhook startup failed")
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def startup(self) -> None:
+        application = self.application
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        if self.webhook_url:
+            await application.bot.set_webhook(
+                self.webhook_url + self.path,
+                secret_token=self.secret_token,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        self._started = True
+        self.accepting = True
+        logger.info("webhook is accepting updates on %s", self.path)
+
+    async def shutdown(self) -> None:
+        """Перестать принимать апдейты и дождаться обработки уже принятых."""
+        self.accepting = False
+        application = self.application
+        if self._started:
+            self._started = False
+            if application.running:
+                await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        logger.info("webhook stopped, in-flight updates drained")
+
+    async def _http(self, scope, receive, send) -> None:
+        if scope["method"] == "GET" and scope["path"] == "/healthz":
+            await self._respond(send, 200 if self.accepting else 503)
+            return
+        if scope["method"] != "POST" or scope["path"] != self.path:
+            await self._respond(send, 404)
+            return
+        if not self.accepting:
+            await self._respond(send, 503)
+            return
+
+        headers = dict(scope["headers"])
+        if not secrets.compare_digest(headers.get(SECRET_HEADER, b""), self.secret_token.encode()):
+            await self._respond(send, 403)
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError):
+            logger.warning("malformed update received")
+            await self._respond(send, 400)
+            return
+        await self.application.update_queue.put(update)
+        await self._respond(send, 200)
+
+    @staticmethod
+    async def _respond(send, status: int) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-length", b"0")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b""})
+
+
+def run_webhook(  # noqa: PLR0913
+    application: Application,
+    webhook_url: str | None,
+    secret_token: str,
+    *,
+    host: str = "0.0.0.0",
+    port: int = 8080,
+    path: str = "/telegram",
+) -> None:
+    """Запустить uvicorn, SIGTERM/SIGINT останавливают его с дренированием апдейтов."""
+    app = WebhookApp(application, webhook_url, secret_token, path=path)
+    config = uvicorn.Config(
+        app, host=host, port=port, lifespan="on", log_config=None, timeout_graceful_shutdown=30
+    )
+    uvicorn.Server(config).run()